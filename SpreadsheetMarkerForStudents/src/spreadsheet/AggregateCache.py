@@ -0,0 +1,72 @@
+from spreadsheet.Coordinates import Coordinates, CellRange
+from spreadsheet.RangeIndex import RangeIndex
+
+
+class AggregateCache:
+    """AggregateCache class
+    Results of the functions applied to ranges, shared by all the
+    formulas of a spreadsheet: formulas with the same SUMA(A1:A5000)
+    term reduce the range once. SUMA and PROMEDIO share the entry, as
+    both reduce a range to its sum.
+
+    The cached ranges are kept in a RangeIndex, so the entries affected
+    by a change of a cell are found without checking every entry.
+    Ranges smaller than `min_size` cells are not cached.
+
+    Attributes
+    ----------
+    min_size: int
+        Minimum number of cells of a range to cache its results
+
+    Methods
+    -------
+    get(function: str, cell_range: CellRange) -> float | None
+        Returns the cached result of a function over a range
+    put(function: str, cell_range: CellRange, value: float)
+        Caches the result of a function over a range
+    invalidate(coords: Coordinates)
+        Forgets the results of the ranges that contain `coords`
+    clear()
+        Forgets all the results
+    """
+    min_size = 64
+
+    def __init__(self):
+        self._values: dict[tuple[str, CellRange], float] = {}
+        self._ranges = RangeIndex()
+
+    def __len__(self):
+        """Number of cached results"""
+        return len(self._values)
+
+    @staticmethod
+    def _key(function: str, cell_range: CellRange) -> tuple[str, CellRange]:
+        """Key of the result of a function over a range"""
+        return ('SUMA' if function == 'PROMEDIO' else function), cell_range
+
+    def get(self, function: str, cell_range: CellRange) -> float | None:
+        """Returns the cached result of a function over a range, or
+        None if it is not cached"""
+        return self._values.get(self._key(function, cell_range))
+
+    def put(self, function: str, cell_range: CellRange, value: float):
+        """Caches the result of a function over a range"""
+        if len(cell_range) < self.min_size:
+            return
+        key = self._key(function, cell_range)
+        if key not in self._values:
+            self._ranges.add(cell_range, key)
+        self._values[key] = value
+
+    def invalidate(self, coords: Coordinates):
+        """Forgets the results of the ranges that contain `coords`"""
+        if not self._values:
+            return
+        for key in self._ranges.covering(coords):
+            del self._values[key]
+            self._ranges.remove(key[1], key)
+
+    def clear(self):
+        """Forgets all the results"""
+        self._values = {}
+        self._ranges = RangeIndex()
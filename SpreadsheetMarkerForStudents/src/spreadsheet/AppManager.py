@@ -1,12 +1,20 @@
+from contextlib import contextmanager
 from pathlib import Path
+from typing import NamedTuple
 import os 
+import time
 
-from copy import deepcopy
-
-from spreadsheet.CLI import CLI
+from spreadsheet.CLI import CLI, parse_command
 from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
+from spreadsheet.ColumnarSpreadsheet import ColumnarSpreadsheet
+from spreadsheet.LazySpreadsheet import LazySpreadsheet
 from spreadsheet.Content import ContentFactory, Formula, Content
 from spreadsheet.FormulaEvaluator import FormulaEvaluator
+from spreadsheet.Recalculator import Recalculator
+from spreadsheet.ParallelRecalculator import ParallelRecalculator
+from spreadsheet.LazyRecalculator import LazyRecalculator
+from spreadsheet.DependencyGraph import DependencyGraph, DependencyDelta
+from spreadsheet import Snapshot
 
 from edu.upc.etsetb.arqsoft.spreadsheet.entities.circular_dependency_exception import CircularDependencyException
 
@@ -16,10 +24,37 @@ class SpreadsheetIO:
     
     File formats supported:
         - sv2
+        - s2b: binary snapshot (see Snapshot)
     """
+    # Size of the write buffer used when saving
+    buffer_size = 1 << 16
+    # Extensions of the files saved as binary snapshots
+    snapshot_suffixes = ('.s2b',)
+    
+    @staticmethod
+    def is_snapshot(path: str | Path) -> bool:
+        """Checks if the file extension of `path` is a binary snapshot one"""
+        return Path(path).suffix.lower() in SpreadsheetIO.snapshot_suffixes
+    
+    @staticmethod
+    def save_snapshot(spreadsheet: Spreadsheet, path: str | Path,
+                      dependencies: DependencyGraph = None):
+        """Saves a spreadsheet into the desired path (s2b format).
+        See Snapshot.save_snapshot"""
+        Snapshot.save_snapshot(spreadsheet, path, dependencies)
+    
+    @staticmethod
+    def load_snapshot(path: str | Path, sparse: bool = False, 
+                      columnar: bool = False) -> tuple[Spreadsheet, DependencyGraph | None]:
+        """Loads a spreadsheet from a file (s2b format).
+        See Snapshot.load_snapshot"""
+        return Snapshot.load_snapshot(path, sparse, columnar)
+    
     @staticmethod
     def save_sheet(spreadsheet: Spreadsheet, path: str | Path):
-        """Saves a spreadsheet into the desired path (sv2 format)
+        """Saves a spreadsheet into the desired path (sv2 format).
+        Each row is written to the file as soon as it is generated,
+        without keeping the whole spreadsheet as strings.
 
         Parameters
         ----------
@@ -31,28 +66,32 @@ class SpreadsheetIO:
         path = Path(path)
         if path.is_dir():
             path = path / 'sheet.sv2'
-        values = spreadsheet.get_values()
-        
-        # Clean values for saving
-        for i in range(len(values)):
-            row = values[i]
-            row = [val.replace(";", ",") if val != "0" else "" for val in row]
-            while row and row[-1] == "":
-                row.pop()
-            values[i] = row
-        
-        with path.open(mode='w') as f:
-            f.writelines([';'.join(row) + '\n' for row in values])
+        with path.open(mode='w', buffering=SpreadsheetIO.buffer_size) as f:
+            for row in spreadsheet.iter_values():
+                # Clean values for saving
+                row = [val.replace(";", ",") if val != "0" else "" for val in row]
+                while row and row[-1] == "":
+                    row.pop()
+                f.write(';'.join(row))
+                f.write('\n')
             f.write("\n")
         
     @staticmethod
-    def load_sheet(path: str | Path) -> Spreadsheet:
-        """Loads a spreadsheet from a file (sv2 format)
+    def load_sheet(path: str | Path, sparse: bool = False, 
+                   columnar: bool = False) -> Spreadsheet:
+        """Loads a spreadsheet from a file (sv2 format).
+        The file is read line by line and only the non-empty cells are
+        inserted in the spreadsheet. Empty lines are empty rows.
 
         Parameters
         ----------
         path: str | path
             The path to the file to read
+        sparse: bool
+            Whether the loaded spreadsheet uses the sparse storage mode
+        columnar: bool
+            Whether the loaded spreadsheet stores the numbers by column
+            (see ColumnarSpreadsheet)
             
         Returns
         -------
@@ -60,26 +99,64 @@ class SpreadsheetIO:
             The parsed spreadsheet
         """
         path = Path(path)
-        rows = []
+        sheet_class = ColumnarSpreadsheet if columnar else Spreadsheet
+        sheet = sheet_class("sheet", 1, 1, sparse)
         with path.open(mode='r') as f:
-            for line in f.readlines():
-                if (line := line.strip()):
-                    rows.append(line.split(";"))
-        rows = [[
-            val.replace(",", ";")
-            for val in row] for row in rows]
-        return Spreadsheet.from_values(rows)
+            # Stream the file: only the current row and the non-empty
+            # cells are kept in memory
+            for row_idx, line in enumerate(f, start=1):
+                if not (line := line.strip()):
+                    continue
+                values = line.split(";")
+                sheet.expand(len(values), row_idx)
+                for col_idx, value in enumerate(values, start=1):
+                    if value:
+                        content = ContentFactory.get(value.replace(",", ";"))
+                        sheet.set_content(Coordinates(col_idx, row_idx), content)
+        return sheet
+        
+
+class ScriptSummary(NamedTuple):
+    """Summary of running a file of commands (see AppManager.run_script)"""
+    commands: int
+    errors: int
+    seconds: float
+    
+    @property
+    def commands_per_second(self) -> float:
+        """Number of commands run per second"""
+        return self.commands / self.seconds if self.seconds else float('inf')
+    
+    def __str__(self):
+        return (f"{self.commands} commands ({self.errors} errors) in "
+                f"{self.seconds:.3f} s: {self.commands_per_second:,.0f} commands/s")
         
 
 class AppManager:
     """AppManager class
     Responsible for controlling the main components of the app.
     """
-    def __init__(self):
-        self.spreadsheet: Spreadsheet = Spreadsheet("empty", 1, 1)
+    def __init__(self, sparse: bool = False, workers: int = 1, 
+                 columnar: bool = False, lazy_evaluation: bool = False):
+        # Storage mode used for the spreadsheets created by the app
+        self.sparse = sparse
+        self.columnar = columnar
+        self.sheet_class = ColumnarSpreadsheet if columnar else Spreadsheet
+        self.spreadsheet: Spreadsheet = self.sheet_class("empty", 1, 1, sparse)
         self.cli: CLI = None
-        # Mapping cell => list of cells
-        self.cell_dependencies: dict[Coordinates, list[Coordinates]] = {}
+        # Dependencies between cells
+        self.cell_dependencies: DependencyGraph = DependencyGraph()
+        # Edits of the current batch (coordinates, previous content and
+        # precedents of the new content), None when there is no batch
+        self._batch: list[tuple[Coordinates, Content, set]] = None
+        # Formulas are recalculated in `workers` processes, or only when
+        # they are read with lazy evaluation
+        if lazy_evaluation:
+            self.recalculator: Recalculator = LazyRecalculator()
+        elif workers > 1:
+            self.recalculator = ParallelRecalculator(workers)
+        else:
+            self.recalculator = Recalculator()
 
     def execute_command(self, cmd: str, **argv):
         """Execute a command given its name and arguments
@@ -87,7 +164,9 @@ class AppManager:
         Parameters
         ----------
         cmd: str
-            Command name. Must be one in ("RF", "C", "E", "L", "S")
+            Command name. Must be one in ("RF", "C", "E", "L", "S") or
+            a viewport command ("J", "SCROLL", "VIEW"), which are 
+            ignored if there is no CLI
         """
         match cmd:
             case "RF":
@@ -97,60 +176,149 @@ class AppManager:
             case "E":
                 self.edit_cell(argv['coordinates'], argv['content'])
             case "L":
-                self.load_sheet_from_file(argv['path'])
+                self.load_spreadsheet_from_file(argv['path'])
             case "S":
-                self.save_sheet_to_file(argv['path'])
+                self.save_spreadsheet_to_file(argv['path'])
+            case "J" if self.cli is not None:
+                self.cli.jump(Coordinates.from_text(argv['coordinates']))
+            case "SCROLL" if self.cli is not None:
+                self.cli.scroll(argv['direction'], int(argv['amount'] or 0))
+            case "VIEW" if self.cli is not None:
+                self.cli.set_view(argv['mode'])
+
+    # Maximum number of consecutive edits of a script run in a batch
+    script_batch_size = 1 << 14
 
     def read_commands_from_file(self, path: str | Path):
-        """Run all the commands present in a text file
+        """Run all the commands present in a text file (see run_script)
         
         Parameters
         ----------
         path: str | Path
             Path to the file to read the commands from
         """
+        self.run_script(path)
+        
+    def _script_error(self, msg: str):
+        """Reports an error of a script, if there is a console"""
+        if self.cli is not None:
+            self.cli.cerror(msg)
+    
+    def _run_script_edits(self, edits: list[tuple[int, str, str]]) -> int:
+        """Runs consecutive edits of a script in a single batch. If the
+        batch fails, the edits are run one by one, so only the wrong
+        ones are rejected.
+        
+        Parameters
+        ----------
+        edits: list[tuple[int, str, str]]
+            Line, coordinates and content of each edit
+            
+        Returns
+        -------
+        int
+            Number of edits that failed
+        """
+        if not edits:
+            return 0
+        try:
+            with self.batch():
+                for _, coords, content in edits:
+                    self.edit_cell(coords, content)
+            return 0
+        except Exception:
+            pass
+        errors = 0
+        for line_idx, coords, content in edits:
+            try:
+                self.edit_cell(coords, content)
+            except Exception as err:
+                errors += 1
+                self._script_error(f"Line {line_idx}: {err}")
+        return errors
+    
+    def run_script(self, path: str | Path) -> ScriptSummary:
+        """Runs all the commands present in a text file. The file is
+        read line by line and nothing is printed for each command.
+        Consecutive edits are run in a single batch (see batch), so the
+        formulas are recalculated once per group of edits.
+        
+        Parameters
+        ----------
+        path: str | Path
+            Path to the file to read the commands from
+            
+        Returns
+        -------
+        ScriptSummary
+            Number of commands and errors and time taken
+        """
         path = Path(path)
         if not path.exists():
-            self.cli.cerror(f"The file {path} does not eist")
-            return
+            self._script_error(f"The file {path} does not exist")
+            return ScriptSummary(0, 1, 0.0)
+        start = time.perf_counter()
+        commands = errors = 0
+        edits = []
         with path.open(mode='r') as file:
-            for line_idx, line in enumerate(file.readlines()):
-                if (parsed := self.cli.parse_command(line)):
-                    cmd, args = parsed
+            for line_idx, line in enumerate(file, start=1):
+                if not (line := line.rstrip("\r\n")).strip():
+                    continue
+                commands += 1
+                if (parsed := parse_command(line)) is None:
+                    errors += 1
+                    self._script_error(f"Wrong command from file at line {line_idx}")
+                    continue
+                cmd, args = parsed
+                if cmd == "E":
+                    edits.append((line_idx, args['coordinates'], args['content']))
+                    if len(edits) >= self.script_batch_size:
+                        errors += self._run_script_edits(edits)
+                        edits = []
+                    continue
+                errors += self._run_script_edits(edits)
+                edits = []
+                if cmd == "EXIT":
+                    break
+                try:
                     self.execute_command(cmd, **args)
-                else:
-                    self.cli.cerror(f"Wrong command from file at "
-                                    f"line {line_idx}")
+                except Exception as err:
+                    errors += 1
+                    self._script_error(f"Line {line_idx}: {err}")
+        errors += self._run_script_edits(edits)
+        summary = ScriptSummary(commands, errors, time.perf_counter() - start)
+        if self.cli is not None:
+            self.cli.cprint(f"[green]{summary}")
+        return summary
+
+    def _replace_spreadsheet(self, spreadsheet: Spreadsheet, dependencies: DependencyGraph):
+        """Replaces the current spreadsheet and its dependencies,
+        closing the file of the previous one if it was lazily loaded"""
+        if isinstance(self.spreadsheet, LazySpreadsheet):
+            self.spreadsheet.close()
+        self.spreadsheet = spreadsheet
+        self.cell_dependencies = dependencies
 
     def create_new_sheet(self):
         """Creates a new empty spreadsheet"""
-        self.spreadsheet = Spreadsheet("my spreadsheet", 10, 10)
+        self._replace_spreadsheet(self.sheet_class("my spreadsheet", 10, 10, self.sparse),
+                                  DependencyGraph())
+        self.recalculator.reset()
         
     
     def _update_dependencies(self, coords: Coordinates, new_content: Content):
         """Update the dependencies between cells."""
-        # Save copy of dependencies for rollback
-        old_dependencies = deepcopy(self.cell_dependencies)
-        
-        # If cell had a formula before, remove dependencies
-        content = self.spreadsheet.cells[coords].get_content()
-        if isinstance(content, Formula):
-            for cell in content.get_dependencies():
-                self.cell_dependencies[cell].remove(coords)
-                
-        # If new content is not formula, no need to add dependencies
-        if not isinstance(new_content, Formula):
-            return
+        # If new content is not formula, the cell does not depend on others
+        precedents = set()
+        if isinstance(new_content, Formula):
+            precedents = set(new_content.get_dependencies())
         
-        # Add new dependencies
-        for cell in new_content.get_dependencies():
-            if cell not in self.cell_dependencies:
-                self.cell_dependencies[cell] = []
-            self.cell_dependencies[cell].append(coords)
+        # Only the edges of this cell change, keep them for rollback
+        delta = self.cell_dependencies.set_precedents(coords, precedents)
         
         # Check for circular dependencies
-        if self.check_circular_dependencies([coords]):
-            self.cell_dependencies = old_dependencies
+        if precedents and self.check_circular_dependencies(coords):
+            self.cell_dependencies.revert(delta)
             raise CircularDependencyException("Formula introduced circular dependencies!")
     
         
@@ -167,61 +335,156 @@ class AppManager:
         """
         coords = Coordinates.from_text(coords)
         content = ContentFactory.get(value)
-        if coords not in self.spreadsheet.cells:
-            self.spreadsheet.expand(coords.col, coords.row)
+        if self._batch is not None:
+            self._batch_edit(coords, content)
+            return
         if isinstance(content, Formula):
             evaluator = FormulaEvaluator(content, self.spreadsheet)
             evaluator.evaluate()
             evaluator.update_dependencies()
         self._update_dependencies(coords, content)
         
-        self.spreadsheet.cells[coords].set_content(content)
+        self.spreadsheet.set_content(coords, content)
         
         # Recompute cells that depend on new cell
-        dependencies = self.cell_dependencies.get(coords, []).copy()
-        recomputed_cells = set()
-        while dependencies:
-            cell = dependencies.pop()
-            # if cell in recomputed_cells:
-            #     raise ValueError("Circular Dependency")
-            recomputed_cells.add(cell)
-            evaluator = FormulaEvaluator(self.spreadsheet.cells[cell].get_content(), 
-                                         self.spreadsheet)
-            evaluator.evaluate()
-            dependencies.extend(self.cell_dependencies.get(cell, []).copy())
-
-            
+        self.recalculator.recalculate(coords, self.spreadsheet, self.cell_dependencies)
         
-    def check_circular_dependencies(self, coords: list[Coordinates]):
-        """Check if there is a circular dependency involving `coords`"""
-        # BFS
-        cells_to_check = coords.copy()
-        checked_cells = set(coords)
-        while cells_to_check:
-            cells_to_check_future = []
-            for cell in cells_to_check:
-                for dep_cell in self.cell_dependencies.get(cell, []):
-                    if dep_cell in checked_cells:
-                        return True
-                    cells_to_check_future.append(dep_cell)
-                    checked_cells.add(dep_cell)
-            cells_to_check = cells_to_check_future
+    def _batch_edit(self, coords: Coordinates, content: Content):
+        """Edits a cell inside a batch: the formula is only compiled,
+        its dependencies are added and it is evaluated when the batch
+        is committed"""
+        precedents = set()
+        if isinstance(content, Formula):
+            FormulaEvaluator(content, self.spreadsheet).update_dependencies()
+            precedents = set(content.get_dependencies())
+        previous = self.spreadsheet.get_cell(coords).get_content()
+        self._batch.append((coords, previous, precedents))
+        self.spreadsheet.set_content(coords, content)
+    
+    @contextmanager
+    def batch(self):
+        """Context manager to edit several cells at once. Inside the 
+        batch the edits are only stored (the values of the formulas are
+        not updated). When the batch ends, the dependencies of all the
+        edits are added at once, cycles are checked once and the
+        affected formulas are recomputed in a single topological 
+        sweep. If anything fails, all the edits of the batch are undone
+        and the error is raised.
         
-        return False
+        Nested batches are part of the outermost one.
+        
+        Example
+        -------
+        >>> with app.batch():
+        ...     app.set_cell_content("A1", "1")
+        ...     app.set_cell_content("A2", "=A1+1")
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = edits = []
+        deltas = []
+        try:
+            yield
+            self._batch = None
+            deltas = self.cell_dependencies.set_many_precedents(
+                {coords: precedents for coords, _, precedents in edits})
+            self.recalculator.recalculate_cells(dict.fromkeys(coords for coords, _, _ in edits), 
+                                                self.spreadsheet, self.cell_dependencies)
+        except BaseException:
+            self._batch = None
+            self._rollback(edits, deltas)
+            raise
+    
+    def _rollback(self, edits: list[tuple[Coordinates, Content, set]],
+                  deltas: list[DependencyDelta]):
+        """Undoes the edits of a batch, in reverse order, and the
+        changes of the dependencies"""
+        self.cell_dependencies.revert_many(deltas)
+        for coords, previous, _ in reversed(edits):
+            self.spreadsheet.set_content(coords, previous)
+        # Recompute the formulas that may have been updated with the
+        # new values. Errors were already there before the batch
+        self.recalculator.recalculate_cells(dict.fromkeys(coords for coords, _, _ in edits),
+                                            self.spreadsheet, self.cell_dependencies, {})
+    
+    def set_cells(self, cells: dict[str, str | float | int]):
+        """Edits several cells in a single batch (see batch)
+        
+        Parameters
+        ----------
+        cells: dict[str, str | float | int]
+            Mapping between the coordinates of each cell in the text 
+            format (Ex: A4) and its new value
+        """
+        with self.batch():
+            for coords, value in cells.items():
+                self.edit_cell(coords, value)
+    
+    def check_circular_dependencies(self, coords: Coordinates):
+        """Check if there is a circular dependency involving `coords`"""
+        return self.cell_dependencies.has_cycle(coords)
 
-    def load_spreadsheet_from_file(self, path: str):
-        """Load a spreadsheet from a path (sv2 format)
+    def load_spreadsheet_from_file(self, path: str, lazy: bool = False):
+        """Load a spreadsheet from a path and evaluate all its
+        formulas. The format is chosen by the file extension (s2b
+        snapshots or sv2 otherwise). The formulas of a snapshot saved
+        with its dependencies are not evaluated again. The current 
+        spreadsheet is kept if the loaded one has circular dependencies.
 
         Parameters
         ----------
         path: str
             Path to the file
+        lazy: bool
+            If True (sv2 files only), the file is memory mapped and its
+            cells are parsed and evaluated when they are first read
+            (see LazySpreadsheet). Circular dependencies are then only 
+            detected when reading the cells involved
         """
         path = os.path.join(os.getcwd(), path)
-        self.spreadsheet = SpreadsheetIO.load_sheet(path)
+        if lazy and not SpreadsheetIO.is_snapshot(path):
+            self.recalculator.reset()
+            dependencies = DependencyGraph()
+            self._replace_spreadsheet(LazySpreadsheet(path, dependencies), dependencies)
+            return
+        if SpreadsheetIO.is_snapshot(path):
+            spreadsheet, dependencies = SpreadsheetIO.load_snapshot(path, self.sparse, 
+                                                                    self.columnar)
+            if dependencies is not None:
+                self.recalculator.reset()
+                self._replace_spreadsheet(spreadsheet, dependencies)
+                return
+        else:
+            spreadsheet = SpreadsheetIO.load_sheet(path, self.sparse, self.columnar)
+        
+        # Collect the dependencies of all the formulas and build the
+        # graph at once
+        precedents = {}
+        errors = {}
+        for coords, cell in spreadsheet.iter_cells():
+            content = cell.get_content()
+            if not isinstance(content, Formula):
+                continue
+            try:
+                FormulaEvaluator(content, spreadsheet).update_dependencies()
+            except Exception as err:
+                errors[coords] = err
+                continue
+            precedents[coords] = set(content.get_dependencies())
+        dependencies = DependencyGraph()
+        dependencies.set_many_precedents(precedents)
+        formulas = list(precedents)
+        
+        # Evaluate all the formulas in a single topological sweep
+        self.recalculator.recalculate_all(formulas, spreadsheet, dependencies)
+        self.recalculator.errors.update(errors)
+        self._replace_spreadsheet(spreadsheet, dependencies)
     
     def save_spreadsheet_to_file(self, path: str):
-        """Saves a spreadsheet to a file (sv2 format)
+        """Saves a spreadsheet to a file. The format is chosen by the
+        file extension: s2b snapshots (including the dependencies
+        between cells) or sv2 otherwise.
 
         Parameters
         ----------
@@ -229,7 +492,10 @@ class AppManager:
             Path to the file
         """
         path = os.path.join(os.getcwd(), path)
-        SpreadsheetIO.save_sheet(self.spreadsheet, path)
+        if SpreadsheetIO.is_snapshot(path):
+            SpreadsheetIO.save_snapshot(self.spreadsheet, path, self.cell_dependencies)
+        else:
+            SpreadsheetIO.save_sheet(self.spreadsheet, path)
         
     def run(self):
         """Runs the program by launching a CLI.
@@ -249,20 +515,17 @@ class AppManager:
         self.edit_cell(coord, str_content)
     
     def get_cell_content_as_float(self, coord):
-        if (coords := Coordinates.from_text(coord)) not in self.spreadsheet.cells:
-            self.spreadsheet.expand(coords.col, coords.row)
-        return float(self.spreadsheet.cells[Coordinates.from_text(coord)].get_value())
+        coords = Coordinates.from_text(coord)
+        return float(self.spreadsheet.get_cell(coords).get_value())
     
     def get_cell_content_as_string(self, coord):
-        if (coords := Coordinates.from_text(coord)) not in self.spreadsheet.cells:
-            self.spreadsheet.expand(coords.col, coords.row)
-        value = self.spreadsheet.cells[Coordinates.from_text(coord)].get_value()
+        coords = Coordinates.from_text(coord)
+        value = self.spreadsheet.get_cell(coords).get_value()
         return value if value else ""
     
     def get_cell_formula_expression(self, coord):
-        if (coords := Coordinates.from_text(coord)) not in self.spreadsheet.cells:
-            self.spreadsheet.expand(coords.col, coords.row)
-        formula: Formula = self.spreadsheet.cells[Coordinates.from_text(coord)].get_content()
+        coords = Coordinates.from_text(coord)
+        formula: Formula = self.spreadsheet.get_cell(coords).get_content()
         return "=" + formula.get_representation().replace(";", ",")
         # return self.get_cell_content_as_string(coord)
         
\ No newline at end of file
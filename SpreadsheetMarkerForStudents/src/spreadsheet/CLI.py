@@ -1,4 +1,4 @@
-from re import match
+import re
 from rich import box
 from rich.console import Console
 from rich.table import Table
@@ -8,20 +8,60 @@ from spreadsheet.Coordinates import Coordinates, col_num2text
 
 # Command list and the regex expression to match
 COMMANDS = {
-    'RF': r'RF',
+    'RF': r'RF (?P<path>.*)',
     'C': r'C',
     'E': r'E (?P<coordinates>.*) (?P<content>.*)',
     'L': r'L (?P<path>.*)',
     'S': r'S (?P<path>.*)',
+    'J': r'J (?P<coordinates>[A-Z]+[0-9]+)',
+    'SCROLL': r'SCROLL (?P<direction>UP|DOWN|LEFT|RIGHT)(?: (?P<amount>[0-9]+))?',
+    'VIEW': r'VIEW (?P<mode>ON|OFF|(?P<columns>[0-9]+)x(?P<rows>[0-9]+))',
     'EXIT': r'EXIT'
 }
+COMMAND_PATTERNS = {cmd_name: re.compile(cmd_pattern) 
+                    for cmd_name, cmd_pattern in COMMANDS.items()}
+
+
+def parse_command(line: str) -> tuple[str, dict] | None:
+    """Parse a command entered in a line into its name and arguments,
+    without printing anything (see CLI.parse_command)"""
+    for cmd_name, cmd_pattern in COMMAND_PATTERNS.items():
+        if (m := cmd_pattern.match(line)):
+            return cmd_name, m.groupdict()
+    return None
 
 
 class CLI:
-    """Command-Line Interface Class"""
-    def __init__(self):
+    """Command-Line Interface Class
+    
+    Only a window of the spreadsheet (the viewport) is printed, so the
+    time to print does not depend on the size of the spreadsheet.
+    
+    Attributes
+    ----------
+    origin: Coordinates
+        Upper-left cell of the viewport
+    viewport_columns: int
+        Number of columns of the viewport
+    viewport_rows: int
+        Number of rows of the viewport
+    render: bool
+        If False, print_spreadsheet does not print anything
+    """
+    # Movement of the viewport for each scroll direction
+    directions = {'UP': (0, -1), 'DOWN': (0, 1), 'LEFT': (-1, 0), 'RIGHT': (1, 0)}
+    
+    def __init__(self, viewport_columns: int = 10, viewport_rows: int = 20,
+                 render: bool = True):
         self._spreadsheet_loaded = False
         self.console = Console()
+        self.origin = Coordinates(1, 1)
+        self.viewport_columns = viewport_columns
+        self.viewport_rows = viewport_rows
+        self.render = render
+        # Last table printed and the window and values it was built from
+        self._table: Table = None
+        self._table_key: tuple = None
 
 
     def cprint(self, msg: str | Table):
@@ -63,11 +103,9 @@ class CLI:
             of the command and a dictionary with the parsed arguments.
             If the command is invalid, returns None
         """
-        for cmd_name, cmd_pattern in COMMANDS.items():
-            if (m := match(cmd_pattern, line)):
-                self.cprint(f"[green]Command found! {m.groupdict()}")
-                return cmd_name, m.groupdict()
-        return None
+        if (parsed := parse_command(line)) is not None:
+            self.cprint(f"[green]Command found! {parsed[1]}")
+        return parsed
 
     def read_command(self) -> tuple[str, dict]:
         """Block the execution and asks for a command as user's input. 
@@ -91,22 +129,69 @@ class CLI:
         return self.read_command()
 
             
+    def jump(self, coords: Coordinates):
+        """Moves the viewport so `coords` is its upper-left cell"""
+        self.origin = coords
+        
+    def scroll(self, direction: str, amount: int = None):
+        """Moves the viewport
+        
+        Parameters
+        ----------
+        direction: str
+            One of "UP", "DOWN", "LEFT" or "RIGHT"
+        amount: int
+            Number of columns or rows to move. By default, a whole 
+            viewport
+        """
+        d_col, d_row = self.directions[direction]
+        d_col *= amount or self.viewport_columns
+        d_row *= amount or self.viewport_rows
+        self.origin = Coordinates(max(1, self.origin.col + d_col), 
+                                  max(1, self.origin.row + d_row))
+        
+    def set_view(self, mode: str):
+        """Configures the viewport
+        
+        Parameters
+        ----------
+        mode: str
+            "ON" or "OFF" to enable or disable printing the spreadsheet,
+            or the size of the viewport as "<columns>x<rows>"
+        """
+        if mode in ("ON", "OFF"):
+            self.render = mode == "ON"
+            return
+        columns, rows = mode.split("x")
+        self.viewport_columns, self.viewport_rows = max(1, int(columns)), max(1, int(rows))
+            
     def print_spreadsheet(self, sheet: Spreadsheet):
-        """Prints on console a rich table with the contents of a
-        spreadsheet.
+        """Prints on console a rich table with the contents of the
+        viewport of a spreadsheet. The table is only built again if the
+        window or the values inside it changed.
         
         Parameters
         ----------
         sheet: Spreadsheet
             The spreadsheet to print on the console
         """
-        ncol, nrow = sheet.size()
-        tab = Table(title=sheet.name)
-        tab.add_column("", justify="right", )
-        for c in range(1, ncol+1):
-            tab.add_column(col_num2text(c))
-        for r in range(1, nrow+1):
-            row_vals = [str(sheet.cells[Coordinates(c,r)]) 
-                        for c in range(1, ncol+1)]
-            tab.add_row(str(r), *[str(val) for val in row_vals])
-        self.cprint(tab)
\ No newline at end of file
+        if not self.render:
+            return
+        # The bounds are read directly: size() may have to read the 
+        # whole spreadsheet (see LazySpreadsheet)
+        last_col = min(sheet.num_columns, self.origin.col + self.viewport_columns - 1)
+        last_row = min(sheet.num_rows, self.origin.row + self.viewport_rows - 1)
+        columns = range(self.origin.col, last_col+1)
+        rows = range(self.origin.row, last_row+1)
+        values = tuple(tuple(str(sheet.get_cell(Coordinates(c, r))) for c in columns) 
+                       for r in rows)
+        key = (sheet.name, columns, rows, values)
+        if key != self._table_key:
+            tab = Table(title=sheet.name)
+            tab.add_column("", justify="right", )
+            for c in columns:
+                tab.add_column(col_num2text(c))
+            for r, row_vals in zip(rows, values):
+                tab.add_row(str(r), *row_vals)
+            self._table, self._table_key = tab, key
+        self.cprint(self._table)
\ No newline at end of file
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+import math
+import operator
+
+from spreadsheet.Content import Content, Numerical
+from spreadsheet.Coordinates import Coordinates, CellRange, pack
+from spreadsheet.Spreadsheet import Spreadsheet, Cell
+from spreadsheet.SegmentTree import SegmentTree
+
+
+class NumericColumn:
+    """NumericColumn class
+    Numbers of a column, stored in a contiguous buffer of doubles with
+    a validity mask (one byte per row). Positions without a number read
+    as 0, like an empty cell.
+
+    The first range sum, minimum or maximum builds a SegmentTree over
+    the values. The trees are then updated with every change, so the
+    following queries cost O(log n).
+
+    Attributes
+    ----------
+    values: array[float]
+        Value of each row (row 1 is at index 0)
+    valid: bytearray
+        1 for the rows that contain a number, 0 otherwise
+    """
+    def __init__(self):
+        self.values = array('d')
+        self.valid = bytearray()
+        self._trees: dict[str, SegmentTree] = {}
+
+    def __len__(self):
+        """Number of rows allocated in the column"""
+        return len(self.valid)
+
+    def _grow(self, num_rows: int):
+        """Allocates the column up to `num_rows` rows"""
+        missing = num_rows - len(self.valid)
+        if missing > 0:
+            self.values.frombytes(bytes(self.values.itemsize * missing))
+            self.valid.extend(bytes(missing))
+            if missing > len(self.values) // 2:
+                # Cheaper to build the trees again when needed
+                self._trees.clear()
+                return
+            for tree in self._trees.values():
+                for _ in range(missing):
+                    tree.append(0.0)
+
+    def _tree(self, function: str) -> SegmentTree:
+        """Returns the tree of a function ('SUMA', 'MIN' or 'MAX') over
+        the values, building it if needed"""
+        tree = self._trees.get(function)
+        if tree is None or len(tree) != len(self.values):
+            tree = SegmentTree(self.values, {'SUMA': operator.add, 'MIN': min}.get(function, max))
+            self._trees[function] = tree
+        return tree
+
+    def _update(self, row: int, value: float):
+        """Updates the trees with the new value of `row`"""
+        for tree in self._trees.values():
+            tree.set(row, value)
+
+    def get(self, row: int) -> float | None:
+        """Returns the number in `row`, or None if there is no number"""
+        if row <= len(self.valid) and self.valid[row-1]:
+            return self.values[row-1]
+        return None
+
+    def set(self, row: int, value: float):
+        """Stores a number in `row`"""
+        self._grow(row)
+        self._update(row, value)
+        self.values[row-1] = value
+        self.valid[row-1] = 1
+
+    def clear(self, row: int):
+        """Removes the number in `row`, if any"""
+        if row <= len(self.valid):
+            self._update(row, 0.0)
+            self.values[row-1] = 0
+            self.valid[row-1] = 0
+
+    def range_sum(self, first_row: int, last_row: int) -> float:
+        """Returns the sum of the values between two rows (both
+        included) in O(log n)"""
+        return self._tree('SUMA').query(first_row, last_row)
+
+    def range_extreme(self, function: str, first_row: int, last_row: int) -> float:
+        """Returns the minimum (function 'MIN') or the maximum ('MAX') of
+        the values between two rows (both included) in O(log n). The
+        rows after the end of the column read as 0"""
+        tree = self._tree(function)
+        result = tree.query(first_row, last_row)
+        if last_row > len(self.values):
+            result = tree.function(result, 0.0)
+        return result
+
+    def slice(self, first_row: int, last_row: int) -> list[float]:
+        """Returns the values between two rows (both included)"""
+        values = self.values[first_row-1:last_row].tolist()
+        if (missing := last_row - first_row + 1 - len(values)) > 0:
+            values.extend([0.0] * missing)
+        return values
+
+
+def as_number(value: float) -> int | float:
+    """Casts the integral values read from a column back to int"""
+    return int(value) if value.is_integer() else value
+
+
+class ColumnarSpreadsheet(Spreadsheet):
+    """ColumnarSpreadsheet class
+    Spreadsheet that stores the numbers column by column, in a
+    NumericColumn per column (about 9 bytes per number instead of a
+    Cell, a Numerical and a Coordinates object). Texts and formulas
+    are kept in `cells`, as in the sparse mode.
+
+    Cells with a number are returned as new Cell objects on demand,
+    so changing their content has no effect on the spreadsheet: use
+    set_content instead. Integral numbers are read back as int.
+
+    The functions over ranges of at least `index_min_size` rows are
+    computed with the trees of the columns (see NumericColumn) and the
+    values of the formulas inside the range, which are found by a
+    binary search on their rows.
+
+    Attributes
+    ----------
+    columns: dict[int, NumericColumn]
+        Numbers of each column
+    index_min_size: int
+        Minimum number of rows of a range to use the trees of the columns
+    """
+    index_min_size = 64
+
+    def __init__(self, name: str, num_columns: int, num_rows: int,
+                 sparse: bool = True):
+        # Only texts and formulas are stored as cells
+        super().__init__(name, num_columns, num_rows, sparse=True)
+        self.columns: dict[int, NumericColumn] = {}
+        # Sorted rows of the texts and formulas of each column
+        self._side_cells: dict[int, list[int]] = {}
+
+    def _get_number(self, coords: Coordinates) -> float | None:
+        """Returns the number stored in `coords`, if any"""
+        if (column := self.columns.get(coords.col)) is None:
+            return None
+        return column.get(coords.row)
+
+    def get_cell(self, coords: Coordinates) -> Cell:
+        if (cell := self.cells.get(coords.key)) is not None:
+            return cell
+        if (value := self._get_number(coords)) is not None:
+            return Cell(coords, Numerical(as_number(value)))
+        return Cell(coords)
+
+    def set_content(self, coords: Coordinates, content: Content):
+        if coords.col > self.num_columns or coords.row > self.num_rows:
+            self.expand(coords.col, coords.row)
+        self.aggregates.invalidate(coords)
+        if isinstance(content, Numerical):
+            if self.cells.pop(coords.key, None) is not None:
+                rows = self._side_cells[coords.col]
+                del rows[bisect_left(rows, coords.row)]
+            column = self.columns.get(coords.col)
+            if column is None:
+                column = self.columns[coords.col] = NumericColumn()
+            column.set(coords.row, content.get_value())
+            return
+        if (column := self.columns.get(coords.col)) is not None:
+            column.clear(coords.row)
+        if (cell := self.cells.get(coords.key)) is not None:
+            cell.set_content(content)
+        else:
+            self.cells[coords.key] = Cell(coords, content)
+            insort(self._side_cells.setdefault(coords.col, []), coords.row)
+
+    def iter_cells(self):
+        """Yields the coordinates and the cell of every cell with
+        content: first the texts and formulas, then the numbers.
+
+        Yields
+        ------
+        tuple[Coordinates, Cell]
+            Coordinates and cell
+        """
+        yield from super().iter_cells()
+        for col, column in self.columns.items():
+            for row_idx, valid in enumerate(column.valid):
+                if valid:
+                    coords = Coordinates(col, row_idx+1)
+                    yield coords, Cell(coords, Numerical(as_number(column.values[row_idx])))
+
+    def get_range_values(self, cell_range: CellRange) -> list[int | float | str]:
+        """Returns the values of the cells inside a range, column by
+        column. The columns without texts or formulas are sliced from
+        their buffer without creating any cell.
+        """
+        values = []
+        first_row, last_row = cell_range.ul.row, cell_range.lr.row
+        for col in range(cell_range.ul.col, cell_range.lr.col+1):
+            column = self.columns.get(col)
+            if not self._side_cells.get(col):
+                if column is None:
+                    values.extend([0] * (last_row - first_row + 1))
+                else:
+                    values.extend(map(as_number, column.slice(first_row, last_row)))
+                continue
+            for row in range(first_row, last_row+1):
+                values.append(self.get_cell(Coordinates(col, row)).get_value())
+        return values
+
+    def _side_values(self, col: int, first_row: int, last_row: int) -> list | None:
+        """Returns the rows and values of the formulas between two rows
+        of a column, or None if there is a text among them"""
+        rows = self._side_cells.get(col, ())
+        values = []
+        for idx in range(bisect_left(rows, first_row), bisect_right(rows, last_row)):
+            value = self.cells[pack(col, rows[idx])].get_value()
+            if isinstance(value, str):
+                return None
+            values.append((rows[idx], value))
+        return values
+
+    def reduce_range(self, function: str, cell_range: CellRange) -> float | None:
+        """Reduces a range with the trees of the columns. Returns None
+        if the range has to be reduced from its values: small ranges or
+        ranges with texts.
+        """
+        first_row, last_row = cell_range.ul.row, cell_range.lr.row
+        if last_row - first_row + 1 < self.index_min_size:
+            return None
+        partials = []
+        for col in range(cell_range.ul.col, cell_range.lr.col+1):
+            column = self.columns.get(col)
+            if (side_values := self._side_values(col, first_row, last_row)) is None:
+                return None
+            if function in ('SUMA', 'PROMEDIO'):
+                if column is not None:
+                    partials.append(column.range_sum(first_row, last_row))
+                partials.extend(value for _, value in side_values)
+                continue
+            # The rows of the formulas hold a 0 in the column, so only
+            # the rows between them are read from the tree
+            start = first_row
+            for row, value in side_values + [(last_row+1, None)]:
+                if start < row:
+                    partials.append(0.0 if column is None else
+                                    column.range_extreme(function, start, row-1))
+                if value is not None:
+                    partials.append(value)
+                start = row + 1
+        if function == 'MIN':
+            return min(partials)
+        if function == 'MAX':
+            return max(partials)
+        return math.fsum(partials)
+
+    def iter_values(self):
+        for row in range(1, self.num_rows+1):
+            values = []
+            for col in range(1, self.num_columns+1):
+                if (cell := self.cells.get(pack(col, row))) is not None:
+                    values.append(str(cell.get_value_to_dump()))
+                elif (column := self.columns.get(col)) is not None and row <= len(column):
+                    values.append(str(as_number(column.values[row-1])))
+                else:
+                    values.append("0")
+            yield values
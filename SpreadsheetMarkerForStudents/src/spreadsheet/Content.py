@@ -1,5 +1,5 @@
 import abc
-from spreadsheet.Coordinates import Coordinates
+from spreadsheet.Coordinates import Coordinates, CellRange
 
 def is_float(txt: str):
     try:
@@ -10,6 +10,8 @@ def is_float(txt: str):
 
 
 class Content:
+    __slots__ = ()
+    
     @abc.abstractclassmethod
     def get_value():
         ...
@@ -25,6 +27,8 @@ class Content:
 
 class Numerical(Content):
     """TODO: Document"""
+    __slots__ = ('_value',)
+    
     def __init__(self, value: float):
         self._value = value
     
@@ -43,6 +47,8 @@ class Numerical(Content):
 
 class Text(Content):
     """TODO: Document"""
+    __slots__ = ('_value',)
+    
     def __init__(self, value: str):
         self._value = value
     
@@ -61,14 +67,23 @@ class Text(Content):
 
 class Formula(Content):
     """TODO: Document"""
+    __slots__ = ('_representation', '_value', '_dependencies', '_program', '_pending')
+    
     def __init__(self, repr: str):
         if repr[0] == '=':
             repr = repr[1:]
         self._representation = repr
         self._value = None
-        self._dependencies: list[Coordinates] = None
+        self._dependencies: list[Coordinates | CellRange] = None
+        # Compiled postfix program, see FormulaEvaluator.compile
+        self._program: list = None
+        # Callback that updates the value when it is out of date, 
+        # see LazyRecalculator
+        self._pending = None
         
     def get_value(self):
+        if self._pending is not None:
+            self._pending()
         if self._value == None:
             raise Exception("Formula not yet evaluated")
         return self._value
@@ -88,6 +103,15 @@ class Formula(Content):
     def set_dependencies(self, dep):
         self._dependencies = dep
     
+    def get_program(self):
+        return self._program
+    
+    def set_program(self, program: list):
+        self._program = program
+    
+    def set_pending(self, callback):
+        self._pending = callback
+    
     def __str__(self):
         return f"{self._representation} [{self._value}]"
     
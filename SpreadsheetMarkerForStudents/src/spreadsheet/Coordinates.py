@@ -1,21 +1,43 @@
 import re
+from functools import lru_cache
 
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.bad_coordinate_exception import BadCoordinateException
+
+# Packed keys: the row goes in the high bits and the column in the low
+# COL_BITS bits, so columns must be below 2^COL_BITS. Keys stay below
+# 2^61 (their own hash) up to 2^37 rows
+COL_BITS = 24
+COL_MASK = (1 << COL_BITS) - 1
+
+A1_REGEX = re.compile(r'([A-Z]+)(\d+)')
+
+
+def pack(col: int, row: int) -> int:
+    """Packs a column and a row in a single integer key"""
+    return (row << COL_BITS) | col
+
+
+def unpack(key: int) -> tuple[int, int]:
+    """Returns the column and the row packed in `key`"""
+    return key & COL_MASK, key >> COL_BITS
+
+
+@lru_cache(maxsize=1 << 14)
 def col_num2text(col_num: int):
-    letter = ''
-    while col_num > 25 + 1:   
-        letter += chr(65 + int((col_num-1)/26) - 1)
-        col_num = col_num - (int((col_num-1)/26))*26
-    letter += chr(65 - 1 + (int(col_num)))
-    return letter
+    letters = ''
+    while col_num:
+        col_num, rest = divmod(col_num - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
 
 
+@lru_cache(maxsize=1 << 14)
 def col_text2num(col_text: str):
-    letters = "~ABCDEFGHIJKLMNOPQRSTUVWXYZ"
     col_num = 0
-    for idx, char in enumerate(col_text[::-1]):
-        col_num += (letters.index(char)) * (26**idx)
+    for char in col_text:
+        col_num = col_num * 26 + ord(char) - 64
     return col_num
-    
+
 
 class Coordinates:
     """Coordinates class.
@@ -27,9 +49,26 @@ class Coordinates:
     
     row: int
         Number indicating the row. First row is 1
+        
+    key: int
+        Column and row packed in a single integer (see pack). It is
+        also the hash
+        
+    Coordinates are used as dict keys everywhere, so they must not be
+    modified once created.
     """
+    __slots__ = ('col', 'row', 'key')
+    
     def __init__(self, col: int, row: int):
+        if not 0 < col <= COL_MASK:
+            raise BadCoordinateException(f"Column {col} out of range")
         self.col, self.row = col, row
+        self.key = (row << COL_BITS) | col
+        
+    @classmethod
+    def from_key(cls, key: int) -> "Coordinates":
+        """Creates the coordinates given their packed key"""
+        return cls(key & COL_MASK, key >> COL_BITS)
         
     @classmethod
     def from_text(cls, text:str) -> "Coordinates":
@@ -45,10 +84,17 @@ class Coordinates:
         -------
         Coordinates
             The corresponding coordinates
+
+        Raises
+        ------
+        BadCoordinateException
+            If the text is not a reference in A1 notation or the column
+            is out of range
         """
-        col_text, row_num, _ = re.split(r'(\d+)', text)
-        col_num = col_text2num(col_text)
-        return cls(col_num, int(row_num))
+        if cls is Coordinates:
+            return text2coords(text)
+        col_text, row_text = parse_a1(text)
+        return cls(col_text2num(col_text), int(row_text))
     
     @classmethod
     def range_from_text(cls, text:str) -> tuple["Coordinates", "Coordinates"]:
@@ -65,8 +111,81 @@ class Coordinates:
     # be a valid dict key    
     def __hash__(self):
         """Hash dunder method"""
-        return hash((self.col, self.row))
+        return self.key
+
+    def __eq__(self, other):
+        """Equal dunder method"""
+        if isinstance(other, Coordinates):
+            return self.key == other.key
+        return NotImplemented
+
+
+def parse_a1(text: str) -> tuple[str, str]:
+    """Returns the column letters and the row digits of a reference in
+    A1 notation. Raises BadCoordinateException if it is not valid"""
+    if (match := A1_REGEX.fullmatch(text)) is None:
+        raise BadCoordinateException(f"Bad coordinates: {text}")
+    return match.groups()
+
+
+@lru_cache(maxsize=1 << 16)
+def text2coords(text: str) -> Coordinates:
+    """Returns the coordinates of a reference in A1 notation. The
+    coordinates are immutable, so the same object is returned for the
+    references parsed recently"""
+    col_text, row_text = parse_a1(text)
+    return Coordinates(col_text2num(col_text), int(row_text))
+
+
+class CellRange:
+    """CellRange class.
+    Rectangle of cells defined by its corners.
+    
+    Attributes
+    ----------
+    ul: Coordinates
+        Upper-left coordinates
+    lr: Coordinates
+        Lower-right coordinates
+    """
+    __slots__ = ('ul', 'lr')
+    
+    def __init__(self, ul: Coordinates, lr: Coordinates):
+        # Normalize the corners, so B3:A1 is the same range as A1:B3
+        self.ul = Coordinates(min(ul.col, lr.col), min(ul.row, lr.row))
+        self.lr = Coordinates(max(ul.col, lr.col), max(ul.row, lr.row))
+        
+    @classmethod
+    def from_text(cls, text: str) -> "CellRange":
+        """Creates the range given the textual representation
+        Example: A1:B3 -> (1,1), (2,3)
+        """
+        return cls(*Coordinates.range_from_text(text))
+    
+    def __repr__(self):
+        """Representation dunder method"""
+        return f"{self.ul}:{self.lr}"
+    
+    def __len__(self):
+        """Number of cells inside the range"""
+        return (self.lr.col - self.ul.col + 1) * (self.lr.row - self.ul.row + 1)
+    
+    def __contains__(self, coords: Coordinates):
+        """Checks if the coordinates are inside the range"""
+        return (self.ul.col <= coords.col <= self.lr.col 
+                and self.ul.row <= coords.row <= self.lr.row)
+    
+    def __iter__(self):
+        """Iterates the coordinates of the range, column by column"""
+        for c in range(self.ul.col, self.lr.col+1):
+            for r in range(self.ul.row, self.lr.row+1):
+                yield Coordinates(c, r)
+    
+    def __hash__(self):
+        """Hash dunder method"""
+        return hash((self.ul, self.lr))
 
     def __eq__(self, other):
         """Equal dunder method"""
-        return (self.col, self.row) == (other.col, other.row)
+        return (isinstance(other, CellRange) 
+                and (self.ul, self.lr) == (other.ul, other.lr))
@@ -0,0 +1,405 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import NamedTuple
+
+from spreadsheet.Coordinates import Coordinates, CellRange
+from spreadsheet.RangeIndex import RangeIndex
+
+
+class DependencyDelta(NamedTuple):
+    """Edges changed when updating the precedents of a formula cell.
+    Used to undo the change (see DependencyGraph.revert)."""
+    coords: Coordinates
+    removed: frozenset
+    added: frozenset
+
+
+class DependencyGraph:
+    """DependencyGraph class
+    Keeps the dependencies between the cells of a spreadsheet.
+    Ranges are kept as a single edge, stored in a RangeIndex.
+
+    A topological order of the formula cells is maintained as the edges
+    change (Pearce-Kelly algorithm): an edge that goes forward in the
+    current order costs O(1), and only an edge that goes backwards
+    searches the cells between its two ends to reorder them. A cycle is
+    found when that search reaches the start of the edge, so checking
+    for cycles after an edit does not traverse the graph. When many
+    formulas change at once (set_many_precedents) the order is computed
+    from scratch instead, as placing the formulas one by one may search
+    the whole graph for each of them.
+
+    Attributes
+    ----------
+    precedents: dict[Coordinates, set[Coordinates | CellRange]]
+        Mapping between each formula cell and the cells and ranges it reads
+    dependents: dict[Coordinates, set[Coordinates]]
+        Mapping between each cell and the formula cells that read it
+        directly (not through a range)
+    ranges: RangeIndex
+        Index of the ranges read by each formula cell
+    order: dict[Coordinates, int]
+        Position of each formula cell in the topological order. Only
+        valid while `is_ordered()`
+
+    Methods
+    -------
+    get_precedents(coords: Coordinates) -> set[Coordinates | CellRange]
+        Returns the cells and ranges read by the formula in `coords`
+    get_dependents(coords: Coordinates) -> set[Coordinates]
+        Returns the formula cells that read `coords`
+    set_precedents(coords: Coordinates, precedents: set) -> DependencyDelta
+        Replaces the edges of the formula in `coords`
+    set_many_precedents(precedents: dict) -> list[DependencyDelta]
+        Replaces the edges of several formulas
+    revert(delta: DependencyDelta)
+        Undoes the change described by `delta`
+    revert_many(deltas: list[DependencyDelta])
+        Undoes several changes, in reverse order
+    has_cycle(coords: Coordinates) -> bool
+        Checks if `coords` depends (directly or indirectly) on itself
+    is_ordered() -> bool
+        Whether `order` is a valid topological order (the graph has no
+        cycles)
+    sort(cells: Iterable[Coordinates]) -> list[Coordinates]
+        Sorts cells by their position in the topological order
+    """
+    # Minimum number of formulas changed at once to compute the order
+    # from scratch
+    bulk_min_size = 64
+
+    def __init__(self):
+        self.precedents: dict[Coordinates, set[Coordinates | CellRange]] = {}
+        self.dependents: dict[Coordinates, set[Coordinates]] = {}
+        self.ranges: RangeIndex = RangeIndex()
+        self.order: dict[Coordinates, int] = {}
+        self._next_position = 0
+        self._ordered = True
+        # Sorted rows of the cells in `order`, by column
+        self._ordered_rows: dict[int, list[int]] = {}
+        # Last change, if it broke an order that was valid before it
+        self._unordered_by: DependencyDelta = None
+
+    def __repr__(self):
+        """Representation dunder method. Just for debugging"""
+        return repr(self.dependents)
+
+    def get_precedents(self, coords: Coordinates) -> set[Coordinates | CellRange]:
+        """Returns the cells and ranges read by the formula in `coords`"""
+        return self.precedents.get(coords, set())
+
+    def get_dependents(self, coords: Coordinates) -> set[Coordinates]:
+        """Returns the formula cells that read `coords`, either
+        directly or through a range"""
+        dependents = self.dependents.get(coords, set())
+        if not len(self.ranges):
+            return dependents
+        return dependents | self.ranges.covering(coords)
+
+    def _add_edges(self, coords: Coordinates, cells):
+        """Adds the edges cell -> coords for each cell in `cells`"""
+        if not cells:
+            return
+        self.precedents.setdefault(coords, set()).update(cells)
+        for cell in cells:
+            if isinstance(cell, CellRange):
+                self.ranges.add(cell, coords)
+            else:
+                self.dependents.setdefault(cell, set()).add(coords)
+
+    def _remove_edges(self, coords: Coordinates, cells):
+        """Removes the edges cell -> coords for each cell in `cells`"""
+        if not cells:
+            return
+        precedents = self.precedents[coords]
+        precedents.difference_update(cells)
+        if not precedents:
+            del self.precedents[coords]
+        for cell in cells:
+            if isinstance(cell, CellRange):
+                self.ranges.remove(cell, coords)
+                continue
+            dependents = self.dependents[cell]
+            dependents.discard(coords)
+            if not dependents:
+                del self.dependents[cell]
+
+    def set_precedents(self,
+                       coords: Coordinates,
+                       precedents: set[Coordinates | CellRange]) -> DependencyDelta:
+        """Replaces the edges of the formula in `coords`. Only the
+        edges that change are touched, so the cost is proportional to
+        the fan-in of the formula.
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the formula cell
+        precedents: set[Coordinates | CellRange]
+            Cells and ranges read by the new formula (empty if the cell
+            does not contain a formula anymore)
+
+        Returns
+        -------
+        DependencyDelta
+            The edges removed and added
+        """
+        ordered = self._ordered
+        delta = self._replace_edges(coords, precedents)
+        self._update_order(coords, delta.added, bool(delta.removed))
+        self._unordered_by = delta if ordered and not self._ordered else None
+        return delta
+
+    def set_many_precedents(self,
+                            precedents: dict[Coordinates, set[Coordinates | CellRange]]
+                            ) -> list[DependencyDelta]:
+        """Replaces the edges of several formulas. If there are at least
+        `bulk_min_size` formulas, the edges are replaced without keeping
+        the order, which is computed from scratch once at the end.
+
+        Parameters
+        ----------
+        precedents: dict[Coordinates, set[Coordinates | CellRange]]
+            Mapping between the coordinates of each formula cell and the
+            cells and ranges it reads
+
+        Returns
+        -------
+        list[DependencyDelta]
+            The edges removed and added for each formula
+        """
+        if len(precedents) < self.bulk_min_size:
+            return [self.set_precedents(coords, cells) for coords, cells in precedents.items()]
+        deltas = [self._replace_edges(coords, cells) for coords, cells in precedents.items()]
+        self._rebuild_order()
+        return deltas
+
+    def _replace_edges(self,
+                       coords: Coordinates,
+                       precedents: set[Coordinates | CellRange]) -> DependencyDelta:
+        """Replaces the edges of the formula in `coords`, without
+        updating the order"""
+        old_precedents = self.get_precedents(coords)
+        removed = frozenset(old_precedents - precedents)
+        added = frozenset(precedents - old_precedents)
+        self._remove_edges(coords, removed)
+        self._add_edges(coords, added)
+        return DependencyDelta(coords, removed, added)
+
+    def revert(self, delta: DependencyDelta):
+        """Undoes the change described by `delta`
+
+        Parameters
+        ----------
+        delta: DependencyDelta
+            Change returned by set_precedents
+        """
+        self._remove_edges(delta.coords, delta.added)
+        self._add_edges(delta.coords, delta.removed)
+        if delta is self._unordered_by:
+            # The order was valid before the change, and it still is
+            # without the edges added: only the removed ones are placed
+            self._ordered = True
+        self._unordered_by = None
+        self._update_order(delta.coords, delta.removed, bool(delta.added))
+
+    def revert_many(self, deltas: list[DependencyDelta]):
+        """Undoes several changes, in reverse order. If there are at
+        least `bulk_min_size` changes, the order is computed from
+        scratch once at the end
+
+        Parameters
+        ----------
+        deltas: list[DependencyDelta]
+            Changes returned by set_precedents or set_many_precedents
+        """
+        if len(deltas) < self.bulk_min_size:
+            for delta in reversed(deltas):
+                self.revert(delta)
+            return
+        for delta in reversed(deltas):
+            self._remove_edges(delta.coords, delta.added)
+            self._add_edges(delta.coords, delta.removed)
+        self._rebuild_order()
+
+    def has_cycle(self, coords: Coordinates) -> bool:
+        """Checks if `coords` depends (directly or indirectly) on itself
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the cell to check
+
+        Returns
+        -------
+        bool
+            True if there is a circular dependency involving `coords`
+        """
+        if self._ordered:
+            return False
+        # DFS over the cells that depend on `coords`
+        stack = list(self.get_dependents(coords))
+        visited = set(stack)
+        while stack:
+            cell = stack.pop()
+            if cell == coords:
+                return True
+            for dependent in self.get_dependents(cell):
+                if dependent not in visited:
+                    visited.add(dependent)
+                    stack.append(dependent)
+        return False
+
+    def is_ordered(self) -> bool:
+        """Whether `order` is a valid topological order of the formula
+        cells, which is the case as long as the graph has no cycles"""
+        return self._ordered
+
+    def sort(self, cells) -> list[Coordinates]:
+        """Sorts cells by their position in the topological order, so
+        every cell comes before the cells that depend on it. Formulas
+        without precedents go first. Only valid while `is_ordered()`
+
+        Parameters
+        ----------
+        cells: Iterable[Coordinates]
+            Cells to sort
+
+        Returns
+        -------
+        list[Coordinates]
+            Cells in topological order
+        """
+        order = self.order
+        return sorted(cells, key=lambda cell: order.get(cell, -1))
+
+    def _cells_in(self, cell_range: CellRange):
+        """Yields the formula cells (the cells in `order`) in a range.
+        They are found with a binary search in each column, so the cost
+        does not depend on the size of the range"""
+        first_row, last_row = cell_range.ul.row, cell_range.lr.row
+        for col in range(cell_range.ul.col, cell_range.lr.col+1):
+            rows = self._ordered_rows.get(col, ())
+            for idx in range(bisect_left(rows, first_row), bisect_right(rows, last_row)):
+                yield Coordinates(col, rows[idx])
+
+    def _index_rows(self):
+        """Indexes the rows of the cells in `order` from scratch"""
+        self._ordered_rows = {}
+        for cell in self.order:
+            self._ordered_rows.setdefault(cell.col, []).append(cell.row)
+        for rows in self._ordered_rows.values():
+            rows.sort()
+
+    def _ordered_precedents(self, coords: Coordinates):
+        """Yields the formula cells read by `coords`, directly or
+        through a range"""
+        for precedent in self.precedents.get(coords, ()):
+            if isinstance(precedent, CellRange):
+                yield from self._cells_in(precedent)
+            elif precedent in self.order:
+                yield precedent
+
+    def _update_order(self, coords: Coordinates, added, removed: bool):
+        """Keeps the topological order after changing the precedents of
+        `coords`: `added` are the new precedents and `removed` tells if
+        any precedent was removed"""
+        if not self._ordered:
+            # Removing edges may have broken the cycle
+            if removed:
+                self._rebuild_order()
+            return
+        order = self.order
+        if coords not in self.precedents:
+            # Not a formula with precedents anymore: it can go anywhere
+            if order.pop(coords, None) is not None:
+                rows = self._ordered_rows[coords.col]
+                del rows[bisect_left(rows, coords.row)]
+            return
+        edges = []
+        if coords not in order:
+            order[coords] = self._next_position
+            self._next_position += 1
+            insort(self._ordered_rows.setdefault(coords.col, []), coords.row)
+            # Formulas that already read the cell must come after it
+            edges.extend((coords, dependent) for dependent in self.get_dependents(coords))
+        for precedent in added:
+            if isinstance(precedent, CellRange):
+                edges.extend((cell, coords) for cell in self._cells_in(precedent))
+            elif precedent in order:
+                edges.append((precedent, coords))
+        for precedent, dependent in edges:
+            if not self._add_to_order(precedent, dependent):
+                self._ordered = False
+                return
+
+    def _add_to_order(self, precedent: Coordinates, dependent: Coordinates) -> bool:
+        """Updates the order for the edge precedent -> dependent.
+        Returns False if the edge closes a cycle"""
+        order = self.order
+        lower, upper = order[dependent], order[precedent]
+        if upper < lower:
+            return True
+        if precedent == dependent:
+            return False
+        # Cells reachable from `dependent` that are placed before `precedent`
+        forward, stack = [], [dependent]
+        visited = {dependent}
+        while stack:
+            cell = stack.pop()
+            forward.append(cell)
+            for next_cell in self.get_dependents(cell):
+                if next_cell == precedent:
+                    return False
+                if next_cell not in visited and order[next_cell] < upper:
+                    visited.add(next_cell)
+                    stack.append(next_cell)
+        # Cells that reach `precedent` and are placed after `dependent`
+        backward, stack = [], [precedent]
+        visited = {precedent}
+        while stack:
+            cell = stack.pop()
+            backward.append(cell)
+            for next_cell in self._ordered_precedents(cell):
+                if next_cell not in visited and order[next_cell] > lower:
+                    visited.add(next_cell)
+                    stack.append(next_cell)
+        # Reuse the positions of both sets: first the cells that reach
+        # `precedent`, then the ones reachable from `dependent`
+        backward.sort(key=order.get)
+        forward.sort(key=order.get)
+        positions = sorted(order[cell] for cell in backward + forward)
+        for cell, position in zip(backward + forward, positions):
+            order[cell] = position
+        return True
+
+    def _rebuild_order(self):
+        """Computes the topological order from scratch. If there is
+        still a cycle the graph is left unordered"""
+        self._ordered = False
+        self._unordered_by = None
+        order, in_progress, visited = [], set(), set()
+        for root in self.precedents:
+            if root in visited:
+                continue
+            visited.add(root)
+            in_progress.add(root)
+            stack = [(root, iter(self.get_dependents(root)))]
+            while stack:
+                cell, dependents = stack[-1]
+                for dependent in dependents:
+                    if dependent in in_progress:
+                        return
+                    if dependent not in visited:
+                        visited.add(dependent)
+                        in_progress.add(dependent)
+                        stack.append((dependent, iter(self.get_dependents(dependent))))
+                        break
+                else:
+                    stack.pop()
+                    in_progress.discard(cell)
+                    order.append(cell)
+        order.reverse()
+        self.order = {cell: position for position, cell in enumerate(order)}
+        self._index_rows()
+        self._next_position = len(order)
+        self._ordered = True
@@ -1,8 +1,20 @@
-from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates, CellRange
 from spreadsheet.Content import Formula
 
 import re
+import math
+import operator
 from itertools import pairwise
+from typing import NamedTuple
+
+
+class FunctionCall(NamedTuple):
+    '''
+    Call to a function inside a compiled formula. It consumes the
+    last `num_args` operands of the stack in one step.
+    '''
+    name: str
+    num_args: int
 
 class Tokenizer:
     '''
@@ -20,19 +32,26 @@ class Tokenizer:
         Takes a list of strings and splits them into tokens.
     tokenize: str -> list[tuple[str, int]]
         Takes a string and splits it into tokens. Returns the tokens.
+    iter_tokens: str -> Iterator[tuple[str, int]]
+        Yields the tokens of a string one by one.
 
     ''' 
         
     token_patterns = [
-        r"^(\+|-|\*|\/|\^)",                         # 0
-        r"^(SUMA|MIN|MAX|PROMEDIO)",                 # 1
-        r"^([A-Z]+[1-9][0-9]*)\:([A-Z]+[1-9][0-9]*)", # 2
-        r"^([A-Z]+[1-9][0-9]*)",                     # 3
-        r"^([0-9])+",                                # 4
-        r"^\(",                                      # 5
-        r"^\)",                                      # 6
-        r"^;",                                       # 7
+        r"\+|-|\*|\/|\^",                             # 0
+        r"SUMA|MIN|MAX|PROMEDIO",                     # 1
+        r"[A-Z]+[1-9][0-9]*\:[A-Z]+[1-9][0-9]*",     # 2
+        r"[A-Z]+[1-9][0-9]*",                         # 3
+        r"[0-9]+",                                    # 4
+        r"\(",                                        # 5
+        r"\)",                                        # 6
+        r";",                                         # 7
     ]
+    
+    # All the patterns in a single regex. The alternatives are tried in
+    # order and the name of the matched group is the token id: T<id>
+    token_regex = re.compile("|".join(f"(?P<T{token_id}>{pattern})" 
+                                      for token_id, pattern in enumerate(token_patterns)))
 
     def __init__(self):
         self.tokens = []
@@ -45,23 +64,26 @@ class Tokenizer:
             self.tokens.append(string.split(' '))
         return self.tokens
     
-    def tokenize(self, repr: str):
+    def iter_tokens(self, repr: str):
         '''
-        Takes a string and splits it into tokens. Returns the tokens.        
+        Yields the tokens of a string one by one. The string is walked with
+        a position index, so tokenizing is linear in the length of the string.
         '''
         repr = repr.replace(" ", "")
-        while repr != "":
-            matched = False
-            for token_id, pattern in enumerate(self.token_patterns):
-                regex_match = re.match(pattern, repr)
-                if regex_match:
-                    matched = True
-                    tok = regex_match.group()
-                    self.tokens.append((tok, token_id))
-                    repr = repr.replace(tok, "", 1)
-                    break
-            if not matched:
+        match = self.token_regex.match
+        pos, end = 0, len(repr)
+        while pos < end:
+            regex_match = match(repr, pos)
+            if regex_match is None:
                 raise Exception("Bad expression")
+            yield regex_match.group(), int(regex_match.lastgroup[1:])
+            pos = regex_match.end()
+    
+    def tokenize(self, repr: str):
+        '''
+        Takes a string and splits it into tokens. Returns the tokens.        
+        '''
+        self.tokens.extend(self.iter_tokens(repr))
         return self.tokens
                     
                     
@@ -92,22 +114,11 @@ class Parser:
     end_rules: list[int]
         List with the rules that determine the possible ending tokens.  
     
-    Static Methods:
-    ---------------
-    _advance_until_closed_parenthesis tokens: list, start_idx: int
-        Advances until the closed parenthesis is found.
-    
     Methods:
     --------
     parse: list[tuple[str, int]] -> list[tuple[str, int]]
         Takes a list of tokens and returns a list of tokens with the
         formula parsed.
-    resolve_ranges:tokens: list[tuple[str, int]], spreadsheet: Spreadsheet -> list[tuple[str, int]]
-        Transform the ranges into list of cells.
-    function2operator function: str, tokens: list[tuple[str, int]], idx: int -> list[tuple[str, int]]:
-        Transforms functions into operators.
-    transform_functions_to_operators tokens: list[tuple[str, int]] -> list[tuple[str, int]]:
-        Given a list of tokens substitute functions with operators    
     
     '''
 
@@ -126,13 +137,6 @@ class Parser:
     # starting/ending rules
     start_rule = [1, 3, 4, 5]
     end_rule = [3, 4, 6]
-    
-    function_operator = {
-        'SUMA': '+',
-        'MIN': 'm',
-        'MAX': 'M',
-        'PROMEDIO': '+'
-    }
 
     def parse(self, tokens: list[tuple[str, int]]) -> list[tuple[str, int]]:
         ''''
@@ -172,162 +176,44 @@ class Parser:
         return tokens
 
 
-    def resolve_ranges(self, tokens: list[tuple[str, int]], spreadsheet: Spreadsheet) -> list[tuple[str, int]]:
-        '''
-        Transform the ranges into list of cells.
-
-        Arguments:
-        ----------
-        tokens: list[tuple[str, int]]
-            List of tuples with the token and its id.
-            The id is the index of the token in the token_patterns list.
-        spreadsheet: Spreadsheet
-            Spreadsheet object that contains the cells.
-        
-        Returns:
-        --------
-        list[tuple[str, int]]        
-        '''
-        print("Resolving ranges...")
-        tokens = tokens.copy()
-        for token, token_id in tokens:
-            if token_id != 2:  # Not a range, skip
-                yield (token, token_id)
-            else:
-                
-                ul, lr = Coordinates.range_from_text(token)
-                coords = spreadsheet.get_range(ul, lr)
-                yield from ((str(coord), 3) for coord in coords)
-                
-    
-    @staticmethod
-    def _advance_until_closed_parenthesis(tokens: list, start_idx: int):
-        '''
-        Advances the index until a closed parenthesis is found.
-
-        Arguments:
-        -----------
-        tokens: list[tuple[str, int]]
-            List of tuples with the token and its id.
-            The id is the index of the token in the token_patterns list.
-        start_idx: int
-            The index to start searching.
-        '''
-        num_open_parenthesis = 1
-        while num_open_parenthesis:
-            _, token_id = tokens[start_idx]
-            if token_id == 5:
-                num_open_parenthesis += 1
-            elif token_id == 6:
-                num_open_parenthesis -= 1
-            start_idx += 1
-        return start_idx
-    
-    
-    def function2operator(self, function: str, tokens: list[tuple[str, int]], idx: int) -> list[tuple[str, int]]:
-        """
-        This method transforms functions into operators.
-
-        Arguments:
-        ----------
-        function: str
-            The function to transform.
-        tokens: list[tuple[str, int]]
-            The list of tokens.
-        idx: int
-            The index of the function token.
-        
-        Returns:
-        --------
-        list[tuple[str, int]]
-        
-        Note: recursive."""
-        operator = self.function_operator[function]
-        num_operands = 0
-        
-        # Start by yielding the open parenthesis token
-        yield ("(", 5)
-        
-        # In the case of average, we add and extra parenthesis
-        if function == 'PROMEDIO':
-            yield ("(", 5)
-        
-        # Traverse all tokens until you find a ")"
-        while idx < len(tokens):
-        # for idx, (token, token_id) in enumerate(tokens):
-            token, token_id = tokens[idx]
-            if token_id == 6:         # close parenthesis
-                break
-            elif token_id == 1:       # another function
-                yield from self.function2operator(token, tokens, idx+2)
-                idx = self._advance_until_closed_parenthesis(tokens, idx+2)
-                num_operands += 1
-            elif token_id in (3, 4):  # cell or value
-                yield (token, token_id)
-                num_operands += 1
-                idx += 1
-            else:
-                idx += 1
-                continue
-            
-            if tokens[idx][1] != 6:
-                yield (operator, 0)
-            
-        # In the case of average, divide by number of operands
-        if function == 'PROMEDIO':
-            yield from ((")", 6), ("/", 0), (f"{num_operands}", 4))  
-        
-        # Close the initial parenthesis
-        yield(")", 6)
-            
-    
-    def transform_functions_to_operators(self, tokens: list[tuple[str, int]]) -> list[tuple[str, int]]:
-        """ Given a list of tokens substitute functions with operators
-        
-        Parameters
-        ----------
-        tokens: list[tuple[str, int]]
-            List of tokens (Assumption: no ranges)
-        idx: int
-            index of the first character
-        """
-        idx = 0
-        while idx < len(tokens):
-            token, token_id = tokens[idx]
-        # for idx, (token, token_id) in enumerate(tokens):
-            if token_id != 1: # Not a function, skip
-                yield (token, token_id)
-                idx += 1
-                continue
-            
-            # Yield the transformed set of tokens
-            idx += 2
-            yield from self.function2operator(token, tokens, idx)
-            
-            # Advance until the outer function is finished
-            idx = self._advance_until_closed_parenthesis(tokens, idx)
-            
-        
-    
 class PostfixExpressionManager():
     '''
     Evaluate the formula introduced by the user.
 
     Methods:
     ------------
+    compile_postfix_expression: list[tuple[str, int]] -> list
+        Returns the postfix expression with symbolic cell references.
     generate_postfix_expression: list[str]
         Returns the postfix expression.
     evaluate_postfix_expression: list[str] -> NumericalValue
         Returns the result of the postfix expression.
+    run_program: list, Spreadsheet -> NumericalValue
+        Returns the result of a compiled postfix expression.
+    reduce_reference: str, CellRange, Spreadsheet -> NumericalValue
+        Returns the result of applying a function to a range argument.
+    evaluate_function: str, list, Spreadsheet -> NumericalValue
+        Returns the result of applying a function to its arguments.
     '''
 
-    # def __init__(self, tokenizer):
-    #     self.tokenizer = tokenizer
+    # Functions applied by each operator
+    operations = {
+        '+': operator.add,
+        '-': operator.sub,
+        '*': operator.mul,
+        '/': operator.truediv,
+        '^': operator.pow,
+    }
     
-    def generate_postfix_expression(self, tokens: list[tuple[str, int]], spreadsheet: Spreadsheet):
+    # Functions supported in formulas
+    functions = ('SUMA', 'MIN', 'MAX', 'PROMEDIO')
+    
+    def compile_postfix_expression(self, tokens: list[tuple[str, int]]) -> list:
         '''
         Generates the postfix expression corresponding to formula as a sequence of formula components.
-        Uses the Shunting-yard algorithm.
+        Uses the Shunting-yard algorithm. Cell references are kept as Coordinates
+        and ranges as CellRange, so the result can be reused to evaluate the formula
+        several times. Each function call becomes a single FunctionCall node.
 
         Parameters:
         -----------
@@ -339,6 +225,8 @@ class PostfixExpressionManager():
 
         stack = []
         output = []
+        # Number of arguments of the functions being compiled
+        num_args = []
         
         # Precedence of operators: determines the order of operations.
         precedence = {
@@ -347,22 +235,28 @@ class PostfixExpressionManager():
             '*': 2,
             '/': 2,
             '^': 3,
-            'M': 3,  # Max
-            'm': 3   # Min
         }
 
+        previous_id = None
         for token, id in tokens:
+            # Consecutive cells inside a function are separate arguments: SUMA(A1A2)
+            if id == 3 and previous_id == 3 and num_args:
+                while stack and stack[-1] != '(':
+                    output.append(stack.pop())
+                num_args[-1] += 1
+            previous_id = id
+            
             # The token is a number
             if id == 4:
                 output.append(float(token))
             
             # The token is a cell reference.
-            if id == 3:
-                coords = Coordinates.from_text(token)
-                if coords not in spreadsheet.cells:
-                    spreadsheet.expand(coords.col, coords.row)
-                value = spreadsheet.cells[coords].get_value()
-                output.append(value)
+            elif id == 3:
+                output.append(Coordinates.from_text(token))
+            
+            # The token is a range reference.
+            elif id == 2:
+                output.append(CellRange.from_text(token))
             
             # The token is an operator.
             elif id == 0:
@@ -374,18 +268,22 @@ class PostfixExpressionManager():
                 stack.append(token)                    
             
             # The token is a function.
-            # elif id == 1:
-            #     # compare the precedence of the token with that of the operator on the top of the stack.
-            #     while stack and stack[-1] == 0 and precedence[stack[-1]] >= precedence[token]:
-            #         formula, _ = stack.pop()
-            #         output.append(formula)
-            #     # push the formula onto the stack.
-            #     stack.append(token)   
+            elif id == 1:
+                stack.append(token)
+                num_args.append(1)
 
             # The token is a left parenthesis.
             elif id == 5:
                 stack.append(token)
             
+            # The token is an argument separator.
+            elif id == 7:
+                while stack and stack[-1] != '(':
+                    output.append(stack.pop())
+                if not num_args:
+                    raise ValueError("Separator outside of a function")
+                num_args[-1] += 1
+            
             # The token is a right parenthesis.
             elif id == 6:
                 while stack and stack[-1] != '(':
@@ -394,14 +292,50 @@ class PostfixExpressionManager():
                     stack.pop() # Remove the left parenthesis.
                 else:
                     raise ValueError("Parenthesis do not match")
+                # The parenthesis closes a function call
+                if stack and stack[-1] in self.functions:
+                    output.append(FunctionCall(stack.pop(), num_args.pop()))
             
         # Empty the stack.
         while stack:
-            if stack[-1] == 5 or stack[-1] == 6:
+            if stack[-1] == '(':
                 raise ValueError("Parenthesis do not match")
             output.append(stack.pop())
         
         return output
+    
+    def generate_postfix_expression(self, tokens: list[tuple[str, int]], spreadsheet: Spreadsheet):
+        '''
+        Generates the postfix expression corresponding to formula as a sequence of formula components,
+        with the cell references replaced by their values.
+
+        Parameters:
+        -----------
+        tokens: list[tuple[str, int]]
+            List of tuples with the token and its id.
+            The id is the index of the token in the token_patterns list.
+        spreadsheet: Spreadsheet
+            Spreadsheet to read the values of the cells from.
+        '''
+        return [self.resolve_reference(token, spreadsheet) 
+                if isinstance(token, (Coordinates, CellRange)) else token
+                for token in self.compile_postfix_expression(tokens)]
+    
+    def resolve_reference(self, reference: Coordinates | CellRange, spreadsheet: Spreadsheet):
+        '''
+        Returns the value of a cell reference, or the list of values of
+        a range reference.
+
+        Parameters:
+        -----------
+        reference: Coordinates | CellRange
+            Reference to resolve.
+        spreadsheet: Spreadsheet
+            Spreadsheet to read the values of the cells from.
+        '''
+        if isinstance(reference, Coordinates):
+            return spreadsheet.get_cell(reference).get_value()
+        return spreadsheet.get_range_values(reference)
                     
     def evaluate_operation(self, a, b, operator):
         '''
@@ -416,30 +350,102 @@ class PostfixExpressionManager():
         operator: str
             Operator to apply to the operands.
         '''
-        if operator == "+":
-            return a + b
-        elif operator == "-":
-            return a - b
-        elif operator == "*":
-            return a * b
-        elif operator == "/":
-            return a / b
-        elif operator == "^":
-            return a ** b
-        elif operator == "m":  # min
-            return min(a, b)
-        elif operator == "M":  # max
-            return max(a, b)
-        else:
+        if operator not in self.operations:
             raise ValueError(f"Bad operator ({operator})")
+        if isinstance(a, (list, CellRange)) or isinstance(b, (list, CellRange)):
+            raise ValueError("Ranges can only be used as function arguments")
+        return self.operations[operator](a, b)
+    
+    def _reduce_range(self, function: str, values: list):
+        '''
+        Reduces the values of a range argument in one pass. Sums use
+        math.fsum, so the result does not depend on the order of the
+        values.
+
+        Arguments:
+        ----------
+        function: str
+            Name of the function.
+        values: list
+            Values of the cells in the range.
+        '''
+        if function == 'MIN':
+            return min(values)
+        if function == 'MAX':
+            return max(values)
+        return math.fsum(values)
+    
+    def reduce_reference(self, function: str, reference: CellRange, spreadsheet: Spreadsheet):
+        '''
+        Applies a function to a range argument. The result is looked up
+        in the aggregates of the spreadsheet first, then computed with
+        its indexes (if it has them) or from the values of the range,
+        and cached for the other formulas.
+
+        Arguments:
+        ----------
+        function: str
+            Name of the function.
+        reference: CellRange
+            Range to reduce.
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the range.
+        '''
+        if (value := spreadsheet.aggregates.get(function, reference)) is not None:
+            return value
+        value = spreadsheet.reduce_range(function, reference)
+        if value is None:
+            value = self._reduce_range(function, self.resolve_reference(reference, spreadsheet))
+        spreadsheet.aggregates.put(function, reference, value)
+        return value
+
+    def evaluate_function(self, function: str, args: list, spreadsheet: Spreadsheet = None):
+        '''
+        Evaluates a function over all its arguments at once.
+
+        Arguments:
+        ----------
+        function: str
+            Name of the function (SUMA, MIN, MAX or PROMEDIO).
+        args: list
+            Arguments of the function. Range arguments are lists of values,
+            or CellRange references to read from the spreadsheet.
+        spreadsheet: Spreadsheet
+            Spreadsheet to read the range references from.
+        '''
+        if function not in self.functions:
+            raise ValueError(f"Bad function ({function})")
+        partials = []
+        count = 0
+        for arg in args:
+            if isinstance(arg, CellRange):
+                partials.append(self.reduce_reference(function, arg, spreadsheet))
+                count += len(arg)
+            elif isinstance(arg, list):
+                partials.append(self._reduce_range(function, arg))
+                count += len(arg)
+            else:
+                partials.append(arg)
+                count += 1
+        if function == 'MIN':
+            return min(partials)
+        if function == 'MAX':
+            return max(partials)
+        total = math.fsum(partials)
+        if function == 'PROMEDIO':
+            return total / count
+        return total
         
-    def evaluate_postfix_expression(self, tokens):
+    def evaluate_postfix_expression(self, tokens, spreadsheet: Spreadsheet = None):
         '''
         Evaluates the postfix expression.
         Arguments:
         ----------
         tokens: list[str]
             Postfix expression.
+        spreadsheet: Spreadsheet
+            Spreadsheet to read the values of the referenced cells from,
+            if the expression contains references.
         
         Returns:
         --------
@@ -447,8 +453,20 @@ class PostfixExpressionManager():
         '''
         stack = []
         for token in tokens:
-            if isinstance(token, (float, int)):
+            if isinstance(token, Coordinates):
+                stack.append(self.resolve_reference(token, spreadsheet))
+            elif isinstance(token, CellRange):
+                # Resolved by the function that reads it, which may use
+                # the indexes of the spreadsheet instead of the values
+                stack.append(token)
+            elif isinstance(token, (float, int, list)):
                 stack.append(token)
+            elif isinstance(token, FunctionCall):
+                if len(stack) < token.num_args:
+                    raise ValueError("Bad expression")
+                args = stack[len(stack)-token.num_args:]
+                del stack[len(stack)-token.num_args:]
+                stack.append(self.evaluate_function(token.name, args, spreadsheet))
             else:
                 if len(stack) < 2:
                     raise ValueError("Bad expression")
@@ -457,9 +475,23 @@ class PostfixExpressionManager():
                     a = stack.pop()
                     stack.append(self.evaluate_operation(a, b, token))
         
-        if len(stack) != 1:
+        if len(stack) != 1 or isinstance(stack[0], (list, CellRange)):
             raise ValueError("Bad expression")
         return stack.pop()     
+    
+    def run_program(self, program: list, spreadsheet: Spreadsheet):
+        '''
+        Evaluates a compiled postfix expression, fetching the values of
+        the referenced cells from the spreadsheet.
+
+        Arguments:
+        ----------
+        program: list
+            Postfix expression generated by compile_postfix_expression.
+        spreadsheet: Spreadsheet
+            Spreadsheet to read the values of the cells from.
+        '''
+        return self.evaluate_postfix_expression(program, spreadsheet)
         
         
 class FormulaEvaluator:
@@ -480,8 +512,12 @@ class FormulaEvaluator:
     --------
     get_tokens: None -> list[tuple[str, int]]
         Get the tokens from the formula representation and parse them.
+    compile: None -> list
+        Compiles the formula into a postfix program, once per formula.
     evaluate: None -> NumericalValue
         Evaluates the formula.
+    set_value: NumericalValue -> None
+        Stores the result of evaluating the formula.
     update_dependencies: None -> None
         Updates the dependencies of the cells involved in the formula.
     
@@ -508,23 +544,42 @@ class FormulaEvaluator:
         # Parse tokens
         parser = Parser()
         self.tokens = parser.parse(tokens)
-        self.tokens = list(parser.resolve_ranges(self.tokens, self.spreadsheet))
-        self.tokens = list(parser.transform_functions_to_operators(self.tokens))
         
         return self.tokens
-        
-    def evaluate(self):
+    
+    def compile(self):
         '''
-        Evaluates the formula.
+        Compiles the formula into a postfix program with symbolic cell
+        references. The program is stored on the formula, so each formula
+        is only tokenized and parsed once.
+
+        Returns:
+        --------
+        program: list
         '''
+        if (program := self.formula.get_program()) is not None:
+            return program
+        
         # Get tokens
         tokens = self.tokens if self.tokens else self.get_tokens()
         
         # Generate Postfix Expression
-        postfix = PostfixExpressionManager()
-        postfix_expression = postfix.generate_postfix_expression(tokens, self.spreadsheet)
-        value = postfix.evaluate_postfix_expression(postfix_expression)
+        program = PostfixExpressionManager().compile_postfix_expression(tokens)
+        self.formula.set_program(program)
+        return program
         
+    def evaluate(self):
+        '''
+        Evaluates the formula.
+        '''
+        program = self.compile()
+        value = PostfixExpressionManager().run_program(program, self.spreadsheet)
+        self.set_value(value)
+    
+    def set_value(self, value):
+        '''
+        Stores the result of evaluating the formula.
+        '''
         # Cast value to integer if possible
         if isinstance(value, float) and value.is_integer():
             value = int(value)
@@ -535,7 +590,11 @@ class FormulaEvaluator:
         '''
         Updates the dependencies of the cells involved in the formula.
         '''
-        # Get tokens
-        tokens = self.tokens if self.tokens else self.get_tokens()
-        cell_tokens = filter(lambda token: token[1] == 3, tokens)
-        self.formula.set_dependencies([Coordinates.from_text(cell) for cell, _ in cell_tokens])
+        program = self.compile()
+        dependencies = []
+        for token in program:
+            if isinstance(token, Coordinates):
+                dependencies.append(token)
+            elif isinstance(token, CellRange):
+                dependencies.append(token)
+        self.formula.set_dependencies(dependencies)
@@ -0,0 +1,157 @@
+from functools import partial
+
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
+from spreadsheet.Coordinates import CellRange
+from spreadsheet.FormulaEvaluator import FormulaEvaluator
+from spreadsheet.DependencyGraph import DependencyGraph
+from spreadsheet.Recalculator import Recalculator
+
+
+class LazyRecalculator(Recalculator):
+    """LazyRecalculator class
+    Recalculator that does not evaluate the formulas affected by an
+    edit: they are only marked as dirty. A dirty formula is evaluated
+    the first time its value is read (see Formula.get_value), after
+    the dirty formulas it depends on. The value is kept until one of
+    its precedents is edited again.
+
+    Every cell that depends on a dirty cell is dirty too, so marking
+    stops at the cells that were already dirty.
+
+    Attributes
+    ----------
+    dirty: set[Coordinates]
+        Formulas whose value is out of date
+
+    Methods
+    -------
+    evaluate_dirty(coords: Coordinates, spreadsheet: Spreadsheet, dependencies: DependencyGraph)
+        Evaluates a dirty formula and the dirty formulas it depends on.
+    """
+    def __init__(self):
+        super().__init__()
+        self.dirty: set[Coordinates] = set()
+
+    def reset(self):
+        super().reset()
+        self.dirty = set()
+
+    def dirty_cells(self,
+                    coords: Coordinates,
+                    dependencies: DependencyGraph) -> list[Coordinates]:
+        """Returns the cells that depend (directly or indirectly) on
+        `coords` and are not dirty yet (in no particular order)"""
+        stack = [cell for cell in dependencies.get_dependents(coords) if cell not in self.dirty]
+        visited = set(stack)
+        while stack:
+            cell = stack.pop()
+            for dependent in dependencies.get_dependents(cell):
+                if dependent not in visited and dependent not in self.dirty:
+                    visited.add(dependent)
+                    stack.append(dependent)
+        return list(visited)
+
+    def recalculate(self,
+                    coords: Coordinates,
+                    spreadsheet: Spreadsheet,
+                    dependencies: DependencyGraph):
+        # The edited cell has a new (already evaluated) content
+        self.dirty.discard(coords)
+        super().recalculate(coords, spreadsheet, dependencies)
+
+    def recalculate_all(self,
+                        cells,
+                        spreadsheet: Spreadsheet,
+                        dependencies: DependencyGraph):
+        # Check for cycles before forgetting the current dirty cells
+        order = self.topological_order(cells, dependencies)
+        self.reset()
+        self.evaluate_cells(order, spreadsheet, dependencies)
+
+    def recalculate_cells(self,
+                          coords,
+                          spreadsheet: Spreadsheet,
+                          dependencies: DependencyGraph,
+                          errors: dict[Coordinates, Exception] = None):
+        # The edited cells have a new content: the formulas among them
+        # are marked as dirty again
+        coords = list(coords)
+        self.dirty.difference_update(coords)
+        super().recalculate_cells(coords, spreadsheet, dependencies, errors)
+
+    def evaluate_cells(self,
+                       cells: list[Coordinates],
+                       spreadsheet: Spreadsheet,
+                       dependencies: DependencyGraph,
+                       errors: dict[Coordinates, Exception] = None):
+        """Marks the formulas in `cells` as dirty, instead of evaluating
+        them"""
+        self.invalidate_aggregates(cells, spreadsheet)
+        for cell in cells:
+            self.dirty.add(cell)
+            spreadsheet.get_cell(cell).get_content().set_pending(
+                partial(self.evaluate_dirty, cell, spreadsheet, dependencies))
+
+    def _dirty_precedents(self,
+                          coords: Coordinates,
+                          dependencies: DependencyGraph):
+        """Yields the dirty cells read by the formula in `coords`"""
+        for precedent in dependencies.get_precedents(coords):
+            if not isinstance(precedent, CellRange):
+                if precedent in self.dirty:
+                    yield precedent
+            elif len(precedent) <= len(self.dirty):
+                yield from (cell for cell in precedent if cell in self.dirty)
+            else:
+                yield from (cell for cell in self.dirty if cell in precedent)
+
+    def evaluate_dirty(self,
+                       coords: Coordinates,
+                       spreadsheet: Spreadsheet,
+                       dependencies: DependencyGraph):
+        """Evaluates a dirty formula and, before it, the dirty formulas
+        it depends on (directly or indirectly)
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the formula
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the cells
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+
+        Raises
+        ------
+        Exception
+            The error raised evaluating the formula, if any
+        """
+        # Post-order of a DFS over the dirty precedents: every formula
+        # comes after the formulas it reads
+        order = []
+        visited = {coords}
+        stack = [(coords, self._dirty_precedents(coords, dependencies))]
+        while stack:
+            cell, precedents = stack[-1]
+            for precedent in precedents:
+                if precedent not in visited:
+                    visited.add(precedent)
+                    stack.append((precedent, self._dirty_precedents(precedent, dependencies)))
+                    break
+            else:
+                stack.pop()
+                order.append(cell)
+
+        for cell in order:
+            formula = spreadsheet.get_cell(cell).get_content()
+            formula.set_pending(None)
+            formula.set_value(None)
+            self.dirty.discard(cell)
+            self.errors.pop(cell, None)
+            try:
+                FormulaEvaluator(formula, spreadsheet).evaluate()
+            except Exception as err:
+                self.errors[cell] = err
+            self.evaluations += 1
+        if coords in self.errors:
+            raise self.errors[coords]
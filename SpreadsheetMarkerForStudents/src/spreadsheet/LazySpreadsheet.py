@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from functools import partial
+import mmap
+from pathlib import Path
+
+from spreadsheet.Spreadsheet import Spreadsheet, Cell
+from spreadsheet.Content import Content, ContentFactory, Formula
+from spreadsheet.Coordinates import Coordinates, CellRange, pack
+from spreadsheet.FormulaEvaluator import FormulaEvaluator
+from spreadsheet.DependencyGraph import DependencyGraph
+
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.circular_dependency_exception import CircularDependencyException
+
+
+class LazySpreadsheet(Spreadsheet):
+    """LazySpreadsheet class
+    Spreadsheet backed by a memory mapped sv2 file. Opening it does not
+    read the file: the offsets of the rows are indexed as far as the
+    rows requested, and a row is parsed the first time one of its cells
+    is accessed. Formulas are evaluated (and registered in the
+    dependency graph) the first time they are read, after the formulas
+    they depend on, without recursion.
+
+    The size of the spreadsheet and iterating it require reading the
+    whole file.
+
+    Attributes
+    ----------
+    dependencies: DependencyGraph
+        Dependencies of the formulas evaluated so far
+    errors: dict[Coordinates, Exception]
+        Formulas that could not be evaluated, with the error raised.
+        Reading their value raises it again
+    """
+    def __init__(self, path: str | Path, dependencies: DependencyGraph = None):
+        super().__init__("sheet", 0, 0, sparse=True)
+        self.dependencies = dependencies if dependencies is not None else DependencyGraph()
+        self.errors: dict[Coordinates, Exception] = {}
+        self._file = Path(path).open(mode='rb')
+        if Path(path).stat().st_size:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = b""
+        # Offset of the first byte of each row indexed so far
+        self._row_offsets: list[int] = [0]
+        self._indexed = not self._buffer
+        self._loaded_rows: set[int] = set()
+        self._evaluated: set[Coordinates] = set()
+
+    def close(self):
+        """Closes the file backing the spreadsheet"""
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def _index_rows(self, row: int):
+        """Indexes the offsets of the rows up to `row` (if it exists)"""
+        offsets = self._row_offsets
+        while not self._indexed and len(offsets) < row:
+            end = self._buffer.find(b"\n", offsets[-1])
+            if end == -1 or end + 1 >= len(self._buffer):
+                self._indexed = True
+            else:
+                offsets.append(end + 1)
+
+    def _load_row(self, row: int):
+        """Parses the cells of a row, if not done yet"""
+        if row in self._loaded_rows:
+            return
+        self._loaded_rows.add(row)
+        self._index_rows(row)
+        if row > len(self._row_offsets):
+            return
+        start = self._row_offsets[row-1]
+        end = self._buffer.find(b"\n", start)
+        line = self._buffer[start:end if end != -1 else len(self._buffer)]
+        if not (line := line.decode().strip()):
+            return
+        for col, value in enumerate(line.split(";"), start=1):
+            # Cells edited before loading their row are kept
+            if value and pack(col, row) not in self.cells:
+                coords = Coordinates(col, row)
+                self.cells[coords.key] = Cell(coords, ContentFactory.get(value.replace(",", ";")))
+
+    def _stored_formula(self, coords: Coordinates) -> Formula | None:
+        """Returns the formula in `coords` if it has not been evaluated
+        yet (None otherwise)"""
+        if coords in self._evaluated:
+            return None
+        self._load_row(coords.row)
+        cell = self.cells.get(coords.key)
+        if cell is not None and isinstance(content := cell.get_content(), Formula):
+            return content
+        return None
+
+    def _pending_precedents(self, coords: Coordinates):
+        """Yields the formulas read by the formula in `coords` that have
+        not been evaluated yet"""
+        formula = self._stored_formula(coords)
+        try:
+            FormulaEvaluator(formula, self).update_dependencies()
+        except Exception:
+            # Fails again when the formula is evaluated
+            return
+        for precedent in formula.get_dependencies():
+            cells = precedent if isinstance(precedent, CellRange) else (precedent,)
+            for cell in cells:
+                if self._stored_formula(cell) is not None:
+                    yield cell
+
+    def _evaluate(self, coords: Coordinates):
+        """Evaluates a formula read for the first time and, before it,
+        the formulas it depends on that were not evaluated yet"""
+        # Post-order of a DFS over the pending precedents: every formula
+        # comes after the formulas it reads. Cells in the DFS stack are
+        # "in progress": reaching one again is a cycle
+        order = []
+        visited, in_progress = {coords}, {coords}
+        stack = [(coords, self._pending_precedents(coords))]
+        while stack:
+            cell, precedents = stack[-1]
+            for precedent in precedents:
+                if precedent in in_progress:
+                    raise CircularDependencyException(f"Circular dependency involving {precedent}")
+                if precedent not in visited:
+                    visited.add(precedent)
+                    in_progress.add(precedent)
+                    stack.append((precedent, self._pending_precedents(precedent)))
+                    break
+            else:
+                stack.pop()
+                in_progress.discard(cell)
+                order.append(cell)
+        for cell in order:
+            self._evaluate_formula(cell, self._stored_formula(cell))
+
+    def _evaluate_formula(self, coords: Coordinates, formula: Formula):
+        """Evaluates a formula whose precedents are already evaluated
+        and registers its dependencies"""
+        try:
+            evaluator = FormulaEvaluator(formula, self)
+            evaluator.update_dependencies()
+            evaluator.evaluate()
+        except Exception as err:
+            self.errors[coords] = err
+            formula.set_pending(partial(self._raise_error, coords, formula))
+        if formula.get_dependencies() is not None:
+            self.dependencies.set_precedents(coords, set(formula.get_dependencies()))
+        self._evaluated.add(coords)
+
+    def _raise_error(self, coords: Coordinates, formula: Formula):
+        """Raises the error of a formula that could not be evaluated
+        when its value is read, until it gets a value"""
+        formula.set_pending(None)
+        try:
+            formula.get_value()
+        except Exception:
+            if (err := self.errors.get(coords)) is None:
+                raise
+            formula.set_pending(partial(self._raise_error, coords, formula))
+            raise err
+
+    def load_all(self):
+        """Parses all the rows of the file and updates the size"""
+        self._index_rows(float('inf'))
+        for row in range(1, len(self._row_offsets)+1):
+            self._load_row(row)
+        for cell in self.cells.values():
+            coords = cell.get_coordinates()
+            self.num_columns = max(self.num_columns, coords.col)
+            self.num_rows = max(self.num_rows, coords.row)
+
+    def get_cell(self, coords: Coordinates) -> Cell:
+        self._load_row(coords.row)
+        cell = super().get_cell(coords)
+        if isinstance(cell.get_content(), Formula) and coords not in self._evaluated:
+            self._evaluate(coords)
+        return cell
+
+    def set_content(self, coords: Coordinates, content: Content):
+        self._load_row(coords.row)
+        self._evaluated.add(coords)
+        self.errors.pop(coords, None)
+        super().set_content(coords, content)
+
+    def size(self) -> tuple[int, int]:
+        self.load_all()
+        return super().size()
+
+    def iter_cells(self):
+        self.load_all()
+        for coords, cell in list(super().iter_cells()):
+            yield coords, self.get_cell(coords)
+
+    def iter_values(self):
+        self.load_all()
+        yield from super().iter_values()
@@ -0,0 +1,183 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
+from spreadsheet.Coordinates import CellRange
+from spreadsheet.FormulaEvaluator import FormulaEvaluator, PostfixExpressionManager
+from spreadsheet.DependencyGraph import DependencyGraph
+from spreadsheet.Recalculator import Recalculator
+
+
+class SnapshotExpressionManager(PostfixExpressionManager):
+    """PostfixExpressionManager that reads the referenced values from
+    a dictionary instead of a spreadsheet. Used by the worker processes,
+    which do not have access to the spreadsheet."""
+    def resolve_reference(self, reference: Coordinates | CellRange, values: dict):
+        return values[reference]
+
+    def reduce_reference(self, function: str, reference: CellRange, values: dict):
+        return self._reduce_range(function, values[reference])
+
+
+def evaluate_chunk(chunk: list[tuple[Coordinates, list]], values: dict) -> list:
+    """Evaluates a chunk of compiled formulas in a worker process
+
+    Parameters
+    ----------
+    chunk: list[tuple[Coordinates, list]]
+        Coordinates and compiled program of each formula
+    values: dict[Coordinates | CellRange, Any]
+        Values of the cells and ranges read by the formulas
+
+    Returns
+    -------
+    list[tuple[Coordinates, Any]]
+        Value of each formula, or the exception raised when evaluating it
+    """
+    manager = SnapshotExpressionManager()
+    results = []
+    for coords, program in chunk:
+        try:
+            results.append((coords, manager.run_program(program, values)))
+        except Exception as err:
+            results.append((coords, err))
+    return results
+
+
+class ParallelRecalculator(Recalculator):
+    """ParallelRecalculator class
+    Recalculator that splits the dirty cells in topological levels. The
+    formulas of a level do not depend on each other, so they are
+    evaluated concurrently in a pool of processes. Only the compiled
+    programs and the values they read are sent to the workers, never
+    the spreadsheet.
+
+    Levels smaller than `min_parallel_size` are evaluated in this
+    process, as well as everything if `workers` is 1 or the pool fails.
+
+    Attributes
+    ----------
+    workers: int
+        Number of worker processes
+    min_parallel_size: int
+        Minimum number of formulas of a level to use the pool
+
+    Methods
+    -------
+    levels(cells: list[Coordinates], dependencies: DependencyGraph) -> list[list[Coordinates]]
+        Splits cells in topological order into independent levels.
+    shutdown()
+        Stops the worker processes.
+    """
+    min_parallel_size = 1000
+
+    def __init__(self, workers: int = None):
+        super().__init__()
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: ProcessPoolExecutor = None
+
+    def shutdown(self):
+        """Stops the worker processes (they are started again if needed)"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def levels(self,
+               cells: list[Coordinates],
+               dependencies: DependencyGraph) -> list[list[Coordinates]]:
+        """Splits the cells in levels: the cells of a level only depend
+        on cells of the previous levels.
+
+        Parameters
+        ----------
+        cells: list[Coordinates]
+            Cells in topological order
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+
+        Returns
+        -------
+        list[list[Coordinates]]
+            Cells of each level
+        """
+        level = dict.fromkeys(cells, 0)
+        levels = []
+        for cell in cells:
+            cell_level = level[cell]
+            if cell_level == len(levels):
+                levels.append([])
+            levels[cell_level].append(cell)
+            for dependent in dependencies.get_dependents(cell):
+                if dependent in level and level[dependent] <= cell_level:
+                    level[dependent] = cell_level + 1
+        return levels
+
+    def evaluate_cells(self,
+                       cells: list[Coordinates],
+                       spreadsheet: Spreadsheet,
+                       dependencies: DependencyGraph,
+                       errors: dict[Coordinates, Exception] = None):
+        if self.workers <= 1 or len(cells) < self.min_parallel_size:
+            super().evaluate_cells(cells, spreadsheet, dependencies, errors)
+            return
+        for level in self.levels(cells, dependencies):
+            if len(level) < self.min_parallel_size:
+                super().evaluate_cells(level, spreadsheet, dependencies, errors)
+                continue
+            try:
+                self._evaluate_level(level, spreadsheet, errors)
+            except (OSError, RuntimeError):
+                # The pool could not be used, continue in this process
+                self.shutdown()
+                self.workers = 1
+                super().evaluate_cells(level, spreadsheet, dependencies, errors)
+
+    def _evaluate_level(self,
+                        level: list[Coordinates],
+                        spreadsheet: Spreadsheet,
+                        errors: dict[Coordinates, Exception] = None):
+        """Evaluates the formulas of a level in the pool of processes"""
+        self.invalidate_aggregates(level, spreadsheet)
+        resolver = PostfixExpressionManager()
+        evaluators = {}
+        results = []
+        chunks = []
+        chunk_size = -(-len(level) // self.workers)
+        for start in range(0, len(level), chunk_size):
+            chunk = []
+            values = {}
+            for cell in level[start:start+chunk_size]:
+                evaluator = FormulaEvaluator(spreadsheet.get_cell(cell).get_content(),
+                                             spreadsheet)
+                evaluators[cell] = evaluator
+                try:
+                    program = evaluator.compile()
+                    for item in program:
+                        if isinstance(item, (Coordinates, CellRange)) and item not in values:
+                            values[item] = resolver.resolve_reference(item, spreadsheet)
+                except Exception as err:
+                    # Fails the same way it would when evaluated here
+                    results.append((cell, err))
+                    continue
+                chunk.append((cell, program))
+            chunks.append((chunk, values))
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [self._pool.submit(evaluate_chunk, chunk, values)
+                   for chunk, values in chunks if chunk]
+        for future in futures:
+            results.extend(future.result())
+
+        first_error = None
+        for cell, value in results:
+            self.evaluations += 1
+            if isinstance(value, Exception):
+                if errors is not None:
+                    errors[cell] = value
+                elif first_error is None:
+                    first_error = value
+                continue
+            evaluators[cell].set_value(value)
+        if first_error is not None:
+            raise first_error
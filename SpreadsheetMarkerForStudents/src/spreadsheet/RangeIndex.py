@@ -0,0 +1,111 @@
+from bisect import bisect_left, insort
+
+from spreadsheet.Coordinates import Coordinates, CellRange
+
+
+class RangeIndex:
+    """RangeIndex class
+    Index of ranges that answers which ranges cover a given cell,
+    without expanding the ranges into their cells.
+
+    Each range is registered in every column it spans. Inside a column
+    the ranges are grouped by height (powers of two) and kept sorted by
+    their first row, so a lookup only does a binary search per group and
+    checks the ranges starting close enough to the requested row.
+
+    Methods
+    -------
+    add(cell_range: CellRange, owner)
+        Registers a range owned by `owner`
+    remove(cell_range: CellRange, owner)
+        Unregisters a range owned by `owner`
+    covering(coords: Coordinates) -> set
+        Returns the owners of the ranges that contain `coords`
+    """
+    def __init__(self):
+        # column => height level => sorted list of (first row, last row, id)
+        self._columns: dict[int, dict[int, list[tuple[int, int, int]]]] = {}
+        self._ids: dict[tuple[CellRange, object], int] = {}
+        self._owners: dict[int, object] = {}
+        self._next_id = 0
+
+    def __len__(self):
+        """Number of ranges in the index"""
+        return len(self._ids)
+
+    @staticmethod
+    def _level(cell_range: CellRange) -> int:
+        """Height level of a range: ranges with a height in
+        [2^level, 2^(level+1)) share the same level"""
+        return (cell_range.lr.row - cell_range.ul.row + 1).bit_length() - 1
+
+    def add(self, cell_range: CellRange, owner):
+        """Registers a range owned by `owner`
+
+        Parameters
+        ----------
+        cell_range: CellRange
+            The range to register
+        owner: Any
+            Object returned when looking up a cell inside the range
+        """
+        if (cell_range, owner) in self._ids:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._ids[(cell_range, owner)] = entry_id
+        self._owners[entry_id] = owner
+        level = self._level(cell_range)
+        entry = (cell_range.ul.row, cell_range.lr.row, entry_id)
+        for col in range(cell_range.ul.col, cell_range.lr.col+1):
+            levels = self._columns.setdefault(col, {})
+            insort(levels.setdefault(level, []), entry)
+
+    def remove(self, cell_range: CellRange, owner):
+        """Unregisters a range owned by `owner`
+
+        Parameters
+        ----------
+        cell_range: CellRange
+            The range to unregister
+        owner: Any
+            Owner used when the range was registered
+        """
+        entry_id = self._ids.pop((cell_range, owner))
+        del self._owners[entry_id]
+        level = self._level(cell_range)
+        entry = (cell_range.ul.row, cell_range.lr.row, entry_id)
+        for col in range(cell_range.ul.col, cell_range.lr.col+1):
+            levels = self._columns[col]
+            entries = levels[level]
+            del entries[bisect_left(entries, entry)]
+            if not entries:
+                del levels[level]
+            if not levels:
+                del self._columns[col]
+
+    def covering(self, coords: Coordinates) -> set:
+        """Returns the owners of the ranges that contain `coords`
+
+        Parameters
+        ----------
+        coords: Coordinates
+            The coordinates to look up
+
+        Returns
+        -------
+        set
+            Owners of the ranges containing the coordinates
+        """
+        owners = set()
+        row = coords.row
+        for level, entries in self._columns.get(coords.col, {}).items():
+            # Ranges of this level ending at `row` or later start after
+            # row - 2^(level+1) + 1
+            lo = bisect_left(entries, (row - (2 << level) + 2,))
+            hi = bisect_left(entries, (row + 1,))
+            for idx in range(lo, hi):
+                _, last_row, entry_id = entries[idx]
+                if last_row >= row:
+                    owners.add(self._owners[entry_id])
+        return owners
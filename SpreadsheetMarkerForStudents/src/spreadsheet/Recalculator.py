@@ -0,0 +1,268 @@
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
+from spreadsheet.Content import Formula
+from spreadsheet.FormulaEvaluator import FormulaEvaluator
+from spreadsheet.DependencyGraph import DependencyGraph
+
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.circular_dependency_exception import CircularDependencyException
+
+
+class Recalculator:
+    """Recalculator class
+    Recomputes the formulas that depend on an edited cell. The dirty
+    cells are sorted topologically once, so each one of them is
+    evaluated exactly once per edit.
+
+    Attributes
+    ----------
+    evaluations: int
+        Number of formulas evaluated in the last recalculation
+    errors: dict[Coordinates, Exception]
+        Formulas that could not be evaluated in the last full
+        recalculation, with the error raised
+
+    Methods
+    -------
+    reset()
+        Forgets the state of the previous recalculations.
+    topological_order(cells: Iterable[Coordinates], dependencies: DependencyGraph) -> list[Coordinates]
+        Returns `cells` and the cells that depend on them, in
+        topological order.
+    dirty_cells(coords: Coordinates, dependencies: DependencyGraph) -> list[Coordinates]
+        Returns the cells that depend (directly or indirectly) on
+        `coords`, in topological order.
+    recalculate(coords: Coordinates, spreadsheet: Spreadsheet, dependencies: DependencyGraph)
+        Recomputes all the formulas that depend on `coords`.
+    recalculate_all(cells: Iterable[Coordinates], spreadsheet: Spreadsheet, dependencies: DependencyGraph)
+        Evaluates the given formulas and their dependents in a single sweep.
+    recalculate_cells(coords: Iterable[Coordinates], spreadsheet: Spreadsheet, dependencies: DependencyGraph, errors: dict)
+        Recomputes the formulas affected by several edited cells in a
+        single sweep.
+    evaluate_cells(cells: list[Coordinates], spreadsheet: Spreadsheet, dependencies: DependencyGraph, errors: dict)
+        Evaluates the formulas in `cells`, in the given order.
+    invalidate_aggregates(cells: list[Coordinates], spreadsheet: Spreadsheet)
+        Forgets the cached results of the ranges containing `cells`.
+    """
+    def __init__(self):
+        self.evaluations = 0
+        self.errors: dict[Coordinates, Exception] = {}
+
+    def reset(self):
+        """Forgets the state of the previous recalculations (used when
+        the spreadsheet is replaced)"""
+        self.evaluations = 0
+        self.errors = {}
+
+    def topological_order(self,
+                          cells,
+                          dependencies: DependencyGraph) -> list[Coordinates]:
+        """Returns `cells` and all the cells that depend on them, sorted
+        so that every cell comes before the cells that depend on it.
+
+        Parameters
+        ----------
+        cells: Iterable[Coordinates]
+            Cells to start from
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+
+        Returns
+        -------
+        list[Coordinates]
+            Cells in topological order
+
+        Raises
+        ------
+        CircularDependencyException
+            If there is a circular dependency between the cells
+        """
+        if dependencies.is_ordered():
+            # The graph keeps a topological order: collect the cells and
+            # sort them by it
+            stack = list(cells)
+            visited = set(stack)
+            while stack:
+                for dependent in dependencies.get_dependents(stack.pop()):
+                    if dependent not in visited:
+                        visited.add(dependent)
+                        stack.append(dependent)
+            return dependencies.sort(visited)
+
+        # Reverse post-order of a DFS over the dependent cells. Cells in
+        # the DFS stack are "in progress": reaching one again is a cycle
+        order = []
+        in_progress = set()
+        visited = set()
+        for root in cells:
+            if root in visited:
+                continue
+            visited.add(root)
+            in_progress.add(root)
+            stack = [(root, iter(dependencies.get_dependents(root)))]
+            while stack:
+                cell, dependents = stack[-1]
+                for dependent in dependents:
+                    if dependent in in_progress:
+                        raise CircularDependencyException(
+                            f"Circular dependency involving {dependent}")
+                    if dependent not in visited:
+                        visited.add(dependent)
+                        in_progress.add(dependent)
+                        stack.append((dependent, iter(dependencies.get_dependents(dependent))))
+                        break
+                else:
+                    stack.pop()
+                    in_progress.discard(cell)
+                    order.append(cell)
+        order.reverse()
+        return order
+
+    def dirty_cells(self,
+                    coords: Coordinates,
+                    dependencies: DependencyGraph) -> list[Coordinates]:
+        """Returns the cells that depend (directly or indirectly) on
+        `coords`, sorted so that every cell comes before the cells that
+        depend on it.
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the edited cell
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+
+        Returns
+        -------
+        list[Coordinates]
+            Dirty cells in topological order
+        """
+        return self.topological_order(dependencies.get_dependents(coords), dependencies)
+
+    def recalculate(self,
+                    coords: Coordinates,
+                    spreadsheet: Spreadsheet,
+                    dependencies: DependencyGraph):
+        """Recomputes all the formulas that depend on `coords`
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the edited cell
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the cells
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+        """
+        self.evaluations = 0
+        self.evaluate_cells(self.dirty_cells(coords, dependencies), spreadsheet, dependencies)
+
+    def recalculate_all(self,
+                        cells,
+                        spreadsheet: Spreadsheet,
+                        dependencies: DependencyGraph):
+        """Evaluates the given formulas and the formulas that depend on
+        them in a single topological sweep. Cycles are detected once
+        for all the cells. A formula that can not be evaluated is left
+        without value and its error is kept in `errors`.
+
+        Parameters
+        ----------
+        cells: Iterable[Coordinates]
+            Coordinates of the formulas to evaluate
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the cells
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+
+        Raises
+        ------
+        CircularDependencyException
+            If there is a circular dependency between the formulas
+        """
+        self.evaluations = 0
+        self.errors = {}
+        self.evaluate_cells(self.topological_order(cells, dependencies), spreadsheet, 
+                            dependencies, self.errors)
+
+    def recalculate_cells(self,
+                          coords,
+                          spreadsheet: Spreadsheet,
+                          dependencies: DependencyGraph,
+                          errors: dict[Coordinates, Exception] = None):
+        """Recomputes the formulas affected by several edited cells:
+        the edited cells that contain a formula and all the formulas
+        that depend on the edited cells. Cycles are detected once, 
+        before evaluating anything.
+
+        Parameters
+        ----------
+        coords: Iterable[Coordinates]
+            Coordinates of the edited cells
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the cells
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+        errors: dict[Coordinates, Exception]
+            If given, the errors are stored in it instead of being raised
+
+        Raises
+        ------
+        CircularDependencyException
+            If there is a circular dependency between the formulas
+        """
+        roots = []
+        for cell in coords:
+            if isinstance(spreadsheet.get_cell(cell).get_content(), Formula):
+                roots.append(cell)
+            roots.extend(dependencies.get_dependents(cell))
+        self.evaluations = 0
+        self.evaluate_cells(self.topological_order(roots, dependencies), spreadsheet,
+                            dependencies, errors)
+
+    def evaluate_cells(self,
+                       cells: list[Coordinates],
+                       spreadsheet: Spreadsheet,
+                       dependencies: DependencyGraph,
+                       errors: dict[Coordinates, Exception] = None):
+        """Evaluates the formulas in `cells`, in the given order
+
+        Parameters
+        ----------
+        cells: list[Coordinates]
+            Coordinates of the formulas, in topological order
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the cells
+        dependencies: DependencyGraph
+            Dependencies between the cells of the spreadsheet
+        errors: dict[Coordinates, Exception]
+            If given, the errors are stored in it instead of being raised
+        """
+        self.invalidate_aggregates(cells, spreadsheet)
+        for cell in cells:
+            evaluator = FormulaEvaluator(spreadsheet.get_cell(cell).get_content(),
+                                         spreadsheet)
+            try:
+                evaluator.evaluate()
+            except Exception as err:
+                if errors is None:
+                    raise
+                errors[cell] = err
+            self.evaluations += 1
+
+    def invalidate_aggregates(self, cells: list[Coordinates], spreadsheet: Spreadsheet):
+        """Forgets the cached results of the ranges that contain the
+        formulas about to be evaluated. The formulas reading a range
+        come after the formulas inside it, so the results cached during
+        the recalculation are already up to date
+
+        Parameters
+        ----------
+        cells: list[Coordinates]
+            Coordinates of the formulas
+        spreadsheet: Spreadsheet
+            Spreadsheet containing the cells
+        """
+        aggregates = spreadsheet.aggregates
+        if not len(aggregates):
+            return
+        for cell in cells:
+            aggregates.invalidate(cell)
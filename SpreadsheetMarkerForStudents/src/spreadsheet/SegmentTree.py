@@ -0,0 +1,98 @@
+from array import array
+import math
+import operator
+
+
+class SegmentTree:
+    """SegmentTree class
+    Tree over a sequence of numbers that answers the minimum, the
+    maximum or the sum of a range and updates a single position in
+    O(log n). Positions start at 1, like the rows of a spreadsheet.
+
+    Updates replace the value of the position and recompute its
+    ancestors from their children, so sums do not accumulate rounding
+    errors with the updates, and a query only adds the nodes that cover
+    the range.
+
+    The leaves are allocated in powers of two, so appending positions
+    only rebuilds the tree when the capacity is doubled.
+
+    Attributes
+    ----------
+    function: Callable[[float, float], float]
+        Function combining two values: min, max or operator.add
+    neutral: float
+        Value that does not change the result of `function`
+
+    Methods
+    -------
+    append(value: float)
+        Adds a new position at the end
+    set(index: int, value: float)
+        Replaces the value in `index`
+    query(first: int, last: int) -> float
+        Reduces the values between two positions (both included)
+    """
+    neutrals = {min: math.inf, max: -math.inf, operator.add: 0.0}
+
+    def __init__(self, values=(), function=min):
+        self.function = function
+        self.neutral = self.neutrals[function]
+        self._build(array('d', values))
+
+    def __len__(self):
+        """Number of positions in the tree"""
+        return self._size
+
+    def _build(self, values: array):
+        """Builds the tree over `values`"""
+        self._size = len(values)
+        capacity = 1
+        while capacity < self._size:
+            capacity *= 2
+        # Node i has children 2i and 2i+1, the leaves start at `capacity`
+        tree = array('d', [self.neutral]) * (2 * capacity)
+        tree[capacity:capacity+self._size] = values
+        function = self.function
+        for index in range(capacity-1, 0, -1):
+            tree[index] = function(tree[2*index], tree[2*index+1])
+        self._capacity, self._tree = capacity, tree
+
+    def append(self, value: float):
+        """Adds a new position at the end with the given value"""
+        if self._size == self._capacity:
+            leaves = self._tree[self._capacity:]
+            leaves.append(value)
+            self._build(leaves)
+        else:
+            self._size += 1
+            self.set(self._size, value)
+
+    def set(self, index: int, value: float):
+        """Replaces the value in `index`"""
+        tree, function = self._tree, self.function
+        index += self._capacity - 1
+        tree[index] = value
+        index //= 2
+        while index:
+            tree[index] = function(tree[2*index], tree[2*index+1])
+            index //= 2
+
+    def query(self, first: int, last: int) -> float:
+        """Reduces the values between two positions (both included).
+        Returns `neutral` if the range is empty"""
+        tree, function = self._tree, self.function
+        result = self.neutral
+        # Half open interval of leaves [low, high)
+        low = max(first, 1) + self._capacity - 1
+        high = min(last, self._size) + self._capacity
+        while low < high:
+            if low & 1:
+                result = function(result, tree[low])
+                low += 1
+            if high & 1:
+                high -= 1
+                result = function(result, tree[high])
+            low //= 2
+            high //= 2
+        return result
@@ -0,0 +1,272 @@
+"""Binary snapshot format of a spreadsheet (.s2b files).
+
+All the integers are little endian. The file contains, in order:
+
+    header      magic b"S2B1", number of columns and rows (2 x u32)
+    numbers     u32 number of columns with numbers, then for each one:
+                u32 column, u32 rows, rows x f64 values, rows x u8 mask
+    texts       strings table (see below)
+    formulas    strings table with the source of each formula, then
+                the cached value of each one: n x f64 value and
+                n x u8 kind (0: no value, 1: float, 2: int, 3: text),
+                followed by a strings table with the text values
+    graph       u8 1 if the dependencies are stored (0 otherwise), then
+                n x i64 number of precedents of each formula, u64
+                number of precedents and 3 x i64 per precedent:
+                (0, key, 0) for a cell or (1, ul key, lr key) for a range
+
+A strings table is a u64 count n, n x i64 packed keys of the cells,
+n x i64 end offsets of each string and u64 size of the UTF-8 blob,
+followed by the blob.
+
+The file is memory mapped when loading and the arrays are copied as
+they are, so no value has to be parsed.
+"""
+from array import array
+import mmap
+from pathlib import Path
+import struct
+
+from spreadsheet.Spreadsheet import Spreadsheet
+from spreadsheet.ColumnarSpreadsheet import ColumnarSpreadsheet, NumericColumn, as_number
+from spreadsheet.Content import Numerical, Text, Formula
+from spreadsheet.Coordinates import Coordinates, CellRange
+from spreadsheet.DependencyGraph import DependencyGraph
+
+MAGIC = b"S2B1"
+HEADER = struct.Struct("<4sII")
+
+
+class SnapshotReader:
+    """Reads the sections of a snapshot from a buffer"""
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def unpack(self, fmt: str) -> tuple:
+        """Reads a struct with the given format"""
+        values = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def bytes(self, size: int) -> memoryview:
+        """Reads `size` bytes, without copying them"""
+        data = memoryview(self.buffer)[self.offset:self.offset+size]
+        self.offset += size
+        return data
+
+    def array(self, typecode: str, count: int) -> array:
+        """Reads an array of `count` items"""
+        values = array(typecode)
+        data = self.bytes(values.itemsize * count)
+        values.frombytes(data)
+        data.release()
+        return values
+
+    def strings(self) -> tuple[array, list[str]]:
+        """Reads a strings table"""
+        count, = self.unpack("<Q")
+        keys = self.array('q', count)
+        ends = self.array('q', count)
+        size, = self.unpack("<Q")
+        blob = bytes(self.bytes(size))
+        strings = []
+        start = 0
+        for end in ends:
+            strings.append(blob[start:end].decode())
+            start = end
+        return keys, strings
+
+
+def write_strings(file, keys: list[int], strings: list[str]):
+    """Writes a strings table"""
+    blob = bytearray()
+    ends = array('q')
+    for string in strings:
+        blob += string.encode()
+        ends.append(len(blob))
+    file.write(struct.pack("<Q", len(keys)))
+    file.write(array('q', keys).tobytes())
+    file.write(ends.tobytes())
+    file.write(struct.pack("<Q", len(blob)))
+    file.write(blob)
+
+
+def numeric_columns(spreadsheet: Spreadsheet) -> dict[int, NumericColumn]:
+    """Returns the numbers of the spreadsheet by column. Zeros are not
+    stored, as in the text format they are read as empty cells."""
+    if isinstance(spreadsheet, ColumnarSpreadsheet):
+        return spreadsheet.columns
+    columns: dict[int, NumericColumn] = {}
+    for coords, cell in spreadsheet.iter_cells():
+        content = cell.get_content()
+        if isinstance(content, Numerical) and content.get_value() != 0:
+            if (column := columns.get(coords.col)) is None:
+                column = columns[coords.col] = NumericColumn()
+            column.set(coords.row, content.get_value())
+    return columns
+
+
+def save_snapshot(spreadsheet: Spreadsheet,
+                  path: str | Path,
+                  dependencies: DependencyGraph = None):
+    """Saves a spreadsheet in the binary snapshot format
+
+    Parameters
+    ----------
+    spreadsheet: Spreadsheet
+        The spreadsheet to save
+    path: str | Path
+        The path to save the file to
+    dependencies: DependencyGraph
+        If given, the dependencies between the cells are stored too,
+        so loading the snapshot does not evaluate the formulas again
+    """
+    texts, formulas = {}, {}
+    for coords, cell in spreadsheet.iter_cells():
+        content = cell.get_content()
+        if isinstance(content, Formula):
+            formulas[coords.key] = content
+        elif isinstance(content, Text):
+            texts[coords.key] = content.get_value()
+
+    with Path(path).open(mode='wb') as f:
+        f.write(HEADER.pack(MAGIC, *spreadsheet.size()))
+
+        columns = numeric_columns(spreadsheet)
+        f.write(struct.pack("<I", len(columns)))
+        for col, column in columns.items():
+            f.write(struct.pack("<II", col, len(column)))
+            f.write(column.values.tobytes())
+            f.write(column.valid)
+
+        write_strings(f, list(texts), list(texts.values()))
+
+        write_strings(f, list(formulas), [formula.get_value_to_dump()
+                                          for formula in formulas.values()])
+        values, kinds = array('d'), bytearray()
+        text_keys, text_values = [], []
+        for key, formula in formulas.items():
+            try:
+                value = formula.get_value()
+            except Exception:
+                # Formula without value (not evaluated or with errors)
+                value = None
+            if isinstance(value, (int, float)):
+                values.append(value)
+                kinds.append(2 if isinstance(value, int) else 1)
+            elif isinstance(value, str):
+                values.append(0)
+                kinds.append(3)
+                text_keys.append(key)
+                text_values.append(value)
+            else:
+                values.append(0)
+                kinds.append(0)
+        f.write(values.tobytes())
+        f.write(kinds)
+        write_strings(f, text_keys, text_values)
+
+        f.write(struct.pack("<B", dependencies is not None))
+        if dependencies is None:
+            return
+        counts, items = array('q'), array('q')
+        for key in formulas:
+            precedents = dependencies.get_precedents(Coordinates.from_key(key))
+            counts.append(len(precedents))
+            for precedent in precedents:
+                if isinstance(precedent, CellRange):
+                    items.extend((1, precedent.ul.key, precedent.lr.key))
+                else:
+                    items.extend((0, precedent.key, 0))
+        f.write(counts.tobytes())
+        f.write(struct.pack("<Q", len(items) // 3))
+        f.write(items.tobytes())
+
+
+def load_snapshot(path: str | Path,
+                  sparse: bool = False,
+                  columnar: bool = False) -> tuple[Spreadsheet, DependencyGraph | None]:
+    """Loads a spreadsheet from a binary snapshot
+
+    Parameters
+    ----------
+    path: str | Path
+        The path to the file to read
+    sparse: bool
+        Whether the loaded spreadsheet uses the sparse storage mode
+    columnar: bool
+        Whether the loaded spreadsheet stores the numbers by column
+
+    Returns
+    -------
+    tuple[Spreadsheet, DependencyGraph | None]
+        The spreadsheet and the dependencies between its cells, or None
+        if they were not stored. In that case the values of the
+        formulas must be computed again
+    """
+    with Path(path).open(mode='rb') as f, \
+         mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        reader = SnapshotReader(buffer)
+        magic, num_columns, num_rows = reader.unpack(HEADER.format)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a spreadsheet snapshot")
+        sheet_class = ColumnarSpreadsheet if columnar else Spreadsheet
+        sheet = sheet_class("sheet", num_columns, num_rows, sparse)
+
+        num_numeric_columns, = reader.unpack("<I")
+        for _ in range(num_numeric_columns):
+            col, length = reader.unpack("<II")
+            column = NumericColumn()
+            column.values = reader.array('d', length)
+            valid = reader.bytes(length)
+            column.valid = bytearray(valid)
+            valid.release()
+            if columnar:
+                sheet.columns[col] = column
+                continue
+            for row_idx, valid in enumerate(column.valid):
+                if valid:
+                    sheet.set_content(Coordinates(col, row_idx+1),
+                                      Numerical(as_number(column.values[row_idx])))
+
+        for key, text in zip(*reader.strings()):
+            sheet.set_content(Coordinates.from_key(key), Text(text))
+
+        formula_keys, sources = reader.strings()
+        values = reader.array('d', len(formula_keys))
+        kinds = reader.bytes(len(formula_keys))
+        formulas = []
+        for key, source, value, kind in zip(formula_keys, sources, values, kinds):
+            formula = Formula(source)
+            if kind in (1, 2):
+                formula.set_value(int(value) if kind == 2 else value)
+            sheet.set_content(coords := Coordinates.from_key(key), formula)
+            formulas.append((coords, formula))
+        kinds.release()
+        for key, text in zip(*reader.strings()):
+            sheet.get_cell(Coordinates.from_key(key)).get_content().set_value(text)
+
+        has_dependencies, = reader.unpack("<B")
+        if not has_dependencies:
+            return sheet, None
+        counts = reader.array('q', len(formulas))
+        num_items, = reader.unpack("<Q")
+        items = reader.array('q', 3 * num_items)
+
+    all_precedents = {}
+    idx = 0
+    for (coords, formula), count in zip(formulas, counts):
+        precedents = []
+        for kind, first, last in zip(*[iter(items[idx:idx+3*count])]*3):
+            if kind:
+                precedents.append(CellRange(Coordinates.from_key(first),
+                                            Coordinates.from_key(last)))
+            else:
+                precedents.append(Coordinates.from_key(first))
+        idx += 3 * count
+        formula.set_dependencies(precedents)
+        all_precedents[coords] = set(precedents)
+    dependencies = DependencyGraph()
+    dependencies.set_many_precedents(all_precedents)
+    return sheet, dependencies
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 from spreadsheet.Content import Content, Numerical, Text, ContentFactory
-from spreadsheet.Coordinates import Coordinates
+from spreadsheet.Coordinates import Coordinates, CellRange
+from spreadsheet.AggregateCache import AggregateCache
 
 class Cell:
     """Cell class
@@ -14,6 +15,8 @@ class Cell:
     content: Content
         The content of the cell
     """
+    __slots__ = ('_coordinates', '_content')
+    
     def __init__(self, coords: Coordinates, content: Content = None):
         if content is None:
             content = Numerical(0)
@@ -37,11 +40,25 @@ class Cell:
         """Get the value of the cell"""
         return self._content
     
+    def get_coordinates(self) -> Coordinates:
+        """Get the coordinates of the cell"""
+        return self._coordinates
+    
     def set_content(self, content: Content):
         """Sets the content of the cell"""
         self._content = content
 
 
+class CellDict(dict):
+    """Dictionary of cells keyed by the packed key of their coordinates
+    (see Coordinates.key). Indexing it with Coordinates looks up their
+    key"""
+    def __missing__(self, key):
+        if isinstance(key, Coordinates):
+            return self[key.key]
+        raise KeyError(key)
+
+
 class Spreadsheet:
     """Spreadsheet class
     Represents the spreadsheet data.
@@ -54,40 +71,69 @@ class Spreadsheet:
         Number of columns of the spreadsheet
     num_rows: int
         Number of rows of the spreadsheet
-    cells: dict[Coordinate, Cell]
-        Dictionary with a mapping between each coordinate and the
-        cell object in that coordinate
+    sparse: bool
+        If True, only the cells with content are stored in `cells`
+        and the empty positions are read as `Numerical(0)` on demand
+    cells: CellDict
+        Dictionary with a mapping between the packed key of each
+        coordinate (see Coordinates.key) and the cell object in that
+        coordinate. In sparse mode it only contains the cells that
+        have been assigned a content
+    aggregates: AggregateCache
+        Results of the functions over ranges read by the formulas.
+        Changing the content of a cell forgets the results of the
+        ranges that contain it
     
     Methods:
     -------
     _initialize_cell_dict(num_columns: int, num_rows: int) -> dict
         Create new dictionary of cells
+    get_cell(coords: Coordinates) -> Cell
+        Returns the cell in the given coordinates
+    set_content(coords: Coordinates, content: Content)
+        Sets the content of the cell in the given coordinates
+    iter_cells() -> Iterator[tuple[Coordinates, Cell]]
+        Yields the coordinates and the cell of every stored cell
     size() -> tuple[int, int]
         Retruns the number of columns and rows of the spreadsheet
     get_range(ul_coord: Coordinates, lr_coord: Coordinates) -> list[Cell]
         Returns a list of cells contained on a range defined by
         the corner coordinates of the range.
+    get_range_values(cell_range: CellRange) -> list[int|float|str]
+        Returns the values of the cells inside a range.
+    reduce_range(function: str, cell_range: CellRange) -> float | None
+        Reduces a range without reading its values, if supported.
+    iter_values() -> Iterator[list[str]]
+        Yields the values (casted to string) of the spreadsheet
+        row by row.
     get_values() -> list[list[str]]
         Return all the values (casted to string) of the
         spreadsheet in matrix form.
     expand(num_cols: int, num_rows: int)
         Expand the spreadsheet to a new size.
     """
-    def __init__(self, name: str, num_columns: int, num_rows: int):
+    def __init__(self, name: str, num_columns: int, num_rows: int,
+                 sparse: bool = False):
         self.name = name
         self.num_columns = num_columns
         self.num_rows = num_rows
-        self.cells: dict[Coordinates, Cell] = {}
-        self._initialize_cell_dict(num_columns, num_rows)
+        self.sparse = sparse
+        self.cells = CellDict()
+        self.aggregates = AggregateCache()
+        if not sparse:
+            self._initialize_cell_dict(num_columns, num_rows)
         
     @classmethod
-    def from_values(cls, values: list[list[int|float|str]]) -> Spreadsheet:
+    def from_values(cls, values: list[list[int|float|str]],
+                    sparse: bool = False) -> Spreadsheet:
         """Creates a Spreadsheet from a matrix of values.
         
         Parameters
         ----------
         values: list[list[int|float|str]]
             Matrix of values to fill the spreadsheet to create
+        sparse: bool
+            Whether to use the sparse storage mode
         
         Returns
         -------
@@ -96,13 +142,12 @@ class Spreadsheet:
         """
         num_rows = len(values)
         num_cols = max([len(row) for row in values])
-        print(f"!!! {num_cols} {num_rows}")
-        sheet: Spreadsheet = cls("sheet", num_cols, num_rows)
+        sheet: Spreadsheet = cls("sheet", num_cols, num_rows, sparse)
         for row_idx, row in enumerate(values):
             for col_idx, value in enumerate(row):
                 content = ContentFactory.get(value)
                 coords = Coordinates(col_idx+1, row_idx+1)
-                sheet.cells[coords].set_content(content)
+                sheet.set_content(coords, content)
         return sheet
     
     def _initialize_cell_dict(self, num_columns: int, num_rows: int) -> dict:
@@ -119,8 +164,63 @@ class Spreadsheet:
         for c in range(1, num_columns+1):
             for r in range(1, num_rows+1):
                 coords = Coordinates(col=c,row=r)
-                if coords not in self.cells:
-                    self.cells[coords] = Cell(coords)
+                if coords.key not in self.cells:
+                    self.cells[coords.key] = Cell(coords)
+
+    def get_cell(self, coords: Coordinates) -> Cell:
+        """Returns the cell in the given coordinates.
+        
+        In dense mode the spreadsheet is expanded if the coordinates
+        are out of bounds. In sparse mode an empty cell is returned
+        for the positions without content, without storing it.
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the cell
+            
+        Returns
+        -------
+        Cell
+            The cell in the given coordinates
+        """
+        if (cell := self.cells.get(coords.key)) is not None:
+            return cell
+        if self.sparse:
+            return Cell(coords)
+        self.expand(coords.col, coords.row)
+        return self.cells[coords.key]
+    
+    def set_content(self, coords: Coordinates, content: Content):
+        """Sets the content of the cell in the given coordinates,
+        expanding the spreadsheet if needed.
+
+        Parameters
+        ----------
+        coords: Coordinates
+            Coordinates of the cell
+        content: Content
+            New content of the cell
+        """
+        if coords.col > self.num_columns or coords.row > self.num_rows:
+            self.expand(coords.col, coords.row)
+        self.aggregates.invalidate(coords)
+        if (cell := self.cells.get(coords.key)) is not None:
+            cell.set_content(content)
+        else:
+            self.cells[coords.key] = Cell(coords, content)
+
+    def iter_cells(self):
+        """Yields the coordinates and the cell of every stored cell.
+        In sparse mode these are only the cells with content.
+        
+        Yields
+        ------
+        tuple[Coordinates, Cell]
+            Coordinates and cell
+        """
+        for cell in self.cells.values():
+            yield cell.get_coordinates(), cell
 
     def size(self) -> tuple[int, int]:
         """Retruns the number of columns and rows of the spreadsheet"""
@@ -151,6 +251,56 @@ class Spreadsheet:
                 ls.append(coords)
         return ls
     
+    def get_range_values(self, cell_range: CellRange) -> list[int | float | str]:
+        """Returns the values of the cells inside a range, column
+        by column.
+
+        Parameters
+        ----------
+        cell_range: CellRange
+            The range to read
+            
+        Returns
+        -------
+        list[int | float | str]
+            Values of the cells inside the range
+        """
+        return [self.get_cell(coords).get_value() for coords in cell_range]
+    
+    def reduce_range(self, function: str, cell_range: CellRange) -> float | None:
+        """Applies a function to a range using an index instead of its
+        values. Storage modes with indexes override it.
+
+        Parameters
+        ----------
+        function: str
+            Name of the function (SUMA, MIN, MAX or PROMEDIO). For
+            PROMEDIO the sum is returned, as the range is one of the
+            arguments averaged
+        cell_range: CellRange
+            The range to reduce
+
+        Returns
+        -------
+        float | None
+            The result, or None if the range has to be reduced from
+            its values
+        """
+        return None
+    
+    def iter_values(self):
+        """Yields the values (casted to string) of the spreadsheet
+        row by row, so only one row is kept in memory at a time.
+        
+        Yields
+        ------
+        list[str]
+            Values of a row
+        """
+        for row in range(1, self.num_rows+1):
+            yield [str(self.get_cell(Coordinates(col, row)).get_value_to_dump())
+                   for col in range(1, self.num_columns+1)]
+    
     def get_values(self):
         """Return all the values (casted to string) of the 
         spreadsheet in matrix form.
@@ -162,20 +312,13 @@ class Spreadsheet:
         list[list[str]]
             Matrix of values
         """
-        values = []
-        for row in range(1, self.num_rows+1):
-            row_values = []
-            for col in range(1, self.num_columns+1):
-                coord = Coordinates(col, row)
-                row_values.append(str(self.cells[coord].get_value_to_dump()))
-            values.append(row_values)
-        
-        return values
+        return list(self.iter_values())
             
     
     def expand(self, num_cols: int, num_rows: int):
         """_summary_
         Expand the spreadsheet to a new size.
+        In sparse mode only the bounds are updated.
 
         Arguments:
         ----------
@@ -184,7 +327,15 @@ class Spreadsheet:
         num_rows : int
                 the new number of rows.
         """
+        old_columns, old_rows = self.num_columns, self.num_rows
         self.num_columns = max(self.num_columns, num_cols)
         self.num_rows = max(self.num_rows, num_rows)
-        self._initialize_cell_dict(self.num_columns, self.num_rows)
+        if self.sparse:
+            return
+        # Only create the cells of the new columns and rows
+        for c in range(1, self.num_columns+1):
+            first_row = old_rows+1 if c <= old_columns else 1
+            for r in range(first_row, self.num_rows+1):
+                coords = Coordinates(col=c, row=r)
+                self.cells[coords.key] = Cell(coords)
         
@@ -0,0 +1,46 @@
+"""Micro-benchmark of the memory used per cell and of the speed of
+looking cells up by their coordinates.
+
+Run from the repository root:
+    export PYTHONPATH="$(pwd)/SpreadsheetMarkerForStudents/src"
+    python3 benchmarks/bench_cells.py
+"""
+import timeit
+import tracemalloc
+
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
+from spreadsheet.Content import ContentFactory
+
+
+def bytes_per_cell(num_cells: int, value) -> float:
+    """Memory allocated per cell when filling a sparse spreadsheet
+    with `num_cells` cells containing `value`"""
+    tracemalloc.start()
+    sheet = Spreadsheet("bench", 1, 1, sparse=True)
+    for row in range(1, num_cells+1):
+        sheet.set_content(Coordinates(1, row), ContentFactory.get(value))
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated / num_cells
+
+
+def lookups_per_second(num_cells: int) -> float:
+    """Lookups in the cells dictionary per second, with coordinates
+    that are reused (as the references of compiled formulas are)"""
+    sheet = Spreadsheet("bench", 1, num_cells)
+    keys = [Coordinates(1, row) for row in range(1, num_cells+1)]
+    cells = sheet.cells
+    seconds = min(timeit.repeat(lambda: [cells[key] for key in keys], number=5, repeat=3))
+    return 5 * num_cells / seconds
+
+
+def main():
+    num_cells = 100_000
+    print(f"{'content':>10} {'bytes/cell':>12}")
+    for name, value in (("number", 3.5), ("text", "hello"), ("formula", "=A1+1")):
+        print(f"{name:>10} {bytes_per_cell(num_cells, value):>12.1f}")
+    print(f"\nlookups/s: {lookups_per_second(num_cells):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
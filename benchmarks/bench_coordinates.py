@@ -0,0 +1,46 @@
+"""Micro-benchmark of the A1 notation codec of Coordinates.
+
+Parses a million references (drawn from a block of 50 columns and
+1000 rows, so most of them repeat, as in real formulas), formats
+them back to text and looks them up in the cells of a spreadsheet.
+
+Run from the repository root:
+    export PYTHONPATH="$(pwd)/SpreadsheetMarkerForStudents/src"
+    python3 benchmarks/bench_coordinates.py
+"""
+import random
+import time
+
+from spreadsheet.Coordinates import Coordinates, col_num2text
+from spreadsheet.Spreadsheet import Spreadsheet
+
+
+def generate_references(num_references: int, num_cols: int, num_rows: int) -> list[str]:
+    """Generates random references in A1 notation"""
+    rng = random.Random(0)
+    return [f"{col_num2text(rng.randint(1, num_cols))}{rng.randint(1, num_rows)}"
+            for _ in range(num_references)]
+
+
+def measure(name: str, func, num_items: int):
+    """Prints the time taken by `func` (best of 3)"""
+    seconds = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+    print(f"{name:>8} {seconds:>10.3f} s {num_items/seconds:>14,.0f} /s")
+
+
+def main():
+    references = generate_references(1_000_000, 50, 1_000)
+    coordinates = [Coordinates.from_text(ref) for ref in references]
+    sheet = Spreadsheet("bench", 50, 1_000)
+    cells = sheet.cells
+    measure("parse", lambda: [Coordinates.from_text(ref) for ref in references], len(references))
+    measure("format", lambda: [repr(coords) for coords in coordinates], len(coordinates))
+    measure("lookup", lambda: [coords.key in cells for coords in coordinates], len(coordinates))
+
+
+if __name__ == "__main__":
+    main()
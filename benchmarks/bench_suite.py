@@ -0,0 +1,267 @@
+"""Benchmark suite of the spreadsheet engine.
+
+Generates synthetic spreadsheets with controlled topologies and
+measures, for each one:
+
+    build           set all the cells in a single batch (set_cells)
+    edit_median     latency of AppManager.edit_cell on an input cell
+    edit_p95        95th percentile of the same latency
+    recalc          full recalculation, until every formula has a value
+    save            SpreadsheetIO.save_sheet (sv2 format)
+    load            AppManager.load_spreadsheet_from_file (sv2 format):
+                    parsing, building the dependencies and evaluating
+    peak_memory     peak of the memory allocated building and
+                    recalculating the spreadsheet (bytes, tracemalloc)
+
+Times are in seconds. All the metrics are better when lower, so a
+metric regresses when it grows more than the threshold with respect to
+the baseline.
+
+Run from the repository root:
+    export PYTHONPATH="$(pwd)/SpreadsheetMarkerForStudents/src:$(pwd)/SpreadsheetMarkerForStudents/test"
+    python3 benchmarks/bench_suite.py --output baseline.json
+    # ... change the code ...
+    python3 benchmarks/bench_suite.py --compare baseline.json
+
+Compare mode exits with status 1 if any metric regressed.
+"""
+import argparse
+import json
+import math
+from pathlib import Path
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from spreadsheet.AppManager import AppManager, SpreadsheetIO
+from spreadsheet.Content import Formula
+from spreadsheet.Coordinates import col_num2text
+
+
+def chain(size: int) -> tuple[dict[str, str], str]:
+    """Long chain: every cell reads the previous one"""
+    cells = {"A1": "1"}
+    for row in range(2, size+1):
+        cells[f"A{row}"] = f"=A{row-1}+1"
+    return cells, "A1"
+
+
+def reverse_chain(size: int) -> tuple[dict[str, str], str]:
+    """Long chain in reverse: every cell reads the next one, so each
+    formula comes before the cells it reads"""
+    cells = {f"A{row}": f"=A{row+1}+1" for row in range(1, size)}
+    cells[f"A{size}"] = "1"
+    return cells, f"A{size}"
+
+
+def fan_in(size: int) -> tuple[dict[str, str], str]:
+    """Wide fan-in: a single formula reads every input cell"""
+    cells = {f"A{row}": str(row) for row in range(1, size+1)}
+    cells["B1"] = "=" + "+".join(f"A{row}" for row in range(1, size+1))
+    return cells, f"A{size // 2}"
+
+
+def diamonds(size: int) -> tuple[dict[str, str], str]:
+    """Layers of diamonds: every cell reads two cells of the previous
+    layer, so each edit of the input reaches every formula through
+    many paths"""
+    width = max(2, math.isqrt(size))
+    cells = {"A1": "1"}
+    for row in range(1, width+1):
+        cells[f"B{row}"] = f"=A1*{row}"
+    for layer in range(3, size // width + 2):
+        col, previous = col_num2text(layer), col_num2text(layer - 1)
+        for row in range(1, width+1):
+            cells[f"{col}{row}"] = f"={previous}{row}+{previous}{row % width + 1}"
+    return cells, "A1"
+
+
+def huge_ranges(size: int) -> tuple[dict[str, str], str]:
+    """Many formulas aggregating the same huge range"""
+    cells = {f"A{row}": str(row) for row in range(1, size+1)}
+    for row in range(1, 51):
+        function = ("SUMA", "PROMEDIO", "MIN", "MAX")[row % 4]
+        cells[f"B{row}"] = f"={function}(A1:A{size})+{row}"
+    return cells, f"A{size // 2}"
+
+
+def mixed_grid(size: int) -> tuple[dict[str, str], str]:
+    """Square grid of numbers and texts, with formulas reading the
+    first column"""
+    side = max(2, math.isqrt(size))
+    cells = {}
+    for row in range(1, side+1):
+        for col in range(1, side+1):
+            ref = f"{col_num2text(col)}{row}"
+            if col == 1:
+                cells[ref] = str(row)
+            elif (row + col) % 5 == 0:
+                cells[ref] = f"text {row} {col}"
+            elif (row + col) % 3 == 0:
+                cells[ref] = f"=A{row}*{col}"
+            else:
+                cells[ref] = str(row * col)
+    return cells, "A1"
+
+
+TOPOLOGIES = {
+    "chain": chain,
+    "reverse_chain": reverse_chain,
+    "fan_in": fan_in,
+    "diamonds": diamonds,
+    "huge_ranges": huge_ranges,
+    "mixed_grid": mixed_grid,
+}
+
+
+def build(cells: dict[str, str], options: dict) -> AppManager:
+    """Creates an AppManager with the given cells"""
+    app = AppManager(**options)
+    app.create_new_sheet()
+    app.set_cells(cells)
+    return app
+
+
+def load(path: Path, options: dict):
+    """Loads a file into a new AppManager"""
+    app = AppManager(**options)
+    app.load_spreadsheet_from_file(str(path))
+    if hasattr(app.recalculator, "shutdown"):
+        app.recalculator.shutdown()
+
+
+def elapsed(func, repeat: int = 1) -> float:
+    """Seconds taken by `func` (best of `repeat` runs)"""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+
+def recalculate(app: AppManager):
+    """Recalculates every formula and reads its value (lazy modes only
+    evaluate the formulas when read)"""
+    formulas = [coords for coords, cell in app.spreadsheet.iter_cells()
+                if isinstance(cell.get_content(), Formula)]
+    app.recalculator.recalculate_all(formulas, app.spreadsheet, app.cell_dependencies)
+    for coords in formulas:
+        try:
+            app.spreadsheet.get_cell(coords).get_value()
+        except Exception:
+            pass
+
+
+def run_topology(topology: str, size: int, edits: int, options: dict) -> dict[str, float]:
+    """Measures all the metrics of a topology"""
+    cells, edited = TOPOLOGIES[topology](size)
+    results = {}
+    app = None
+
+    def build_app():
+        nonlocal app
+        app = build(cells, options)
+    results["build"] = elapsed(build_app)
+
+    latencies = [elapsed(lambda: app.edit_cell(edited, str(value)))
+                 for value in range(edits)]
+    results["edit_median"] = statistics.median(latencies)
+    results["edit_p95"] = statistics.quantiles(latencies, n=20)[-1] if edits > 1 else latencies[0]
+    results["recalc"] = elapsed(lambda: recalculate(app), repeat=3)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / f"{topology}.sv2"
+        results["save"] = elapsed(lambda: SpreadsheetIO.save_sheet(app.spreadsheet, path),
+                                  repeat=3)
+        results["load"] = elapsed(lambda: load(path, options), repeat=3)
+    if hasattr(app.recalculator, "shutdown"):
+        app.recalculator.shutdown()
+
+    # Measured apart, as tracing the allocations slows everything down
+    tracemalloc.start()
+    recalculate(build(cells, options))
+    results["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns the metrics of `current` that are worse than in
+    `baseline` by more than `threshold` (relative)"""
+    regressions = []
+    for topology, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            reference = baseline["results"].get(topology, {}).get(metric)
+            if reference and value > reference * (1 + threshold):
+                regressions.append(f"{topology}.{metric}: {reference:.6g} -> {value:.6g} "
+                                   f"(+{(value / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(report: dict, baseline: dict = None):
+    """Prints the results as a table, with the change with respect to
+    the baseline if given"""
+    print(f"{'topology':>14} {'metric':>12} {'value':>14} {'change':>8}")
+    for topology, metrics in report["results"].items():
+        for metric, value in metrics.items():
+            change = ""
+            if baseline and (reference := baseline["results"].get(topology, {}).get(metric)):
+                change = f"{(value / reference - 1) * 100:+.0f}%"
+            shown = f"{value:,.0f} B" if metric == "peak_memory" else f"{value*1e3:.3f} ms"
+            print(f"{topology:>14} {metric:>12} {shown:>14} {change:>8}")
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    """Parses the command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000,
+                        help="number of cells of each generated spreadsheet")
+    parser.add_argument("--edits", type=int, default=20,
+                        help="number of edits to measure the latency")
+    parser.add_argument("--topology", action="append", choices=list(TOPOLOGIES),
+                        help="topologies to run (all by default)")
+    parser.add_argument("--sparse", action="store_true")
+    parser.add_argument("--columnar", action="store_true")
+    parser.add_argument("--lazy", action="store_true", help="lazy evaluation mode")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="file to write the results to (JSON)")
+    parser.add_argument("--compare", type=Path, help="baseline results to compare with (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative growth of a metric considered a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None) -> int:
+    args = parse_args(argv)
+    options = {"sparse": args.sparse, "columnar": args.columnar,
+               "lazy_evaluation": args.lazy, "workers": args.workers}
+    report = {
+        "python": platform.python_version(),
+        "size": args.size,
+        "options": options,
+        "results": {topology: run_topology(topology, args.size, args.edits, options)
+                    for topology in args.topology or TOPOLOGIES},
+    }
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_results(report, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if baseline is None:
+        return 0
+    if baseline.get("size") != report["size"] or baseline.get("options") != options:
+        print("\nwarning: the baseline was run with a different size or options")
+    if regressions := compare(report, baseline, args.threshold):
+        print(f"\n{len(regressions)} regressions (threshold {args.threshold:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
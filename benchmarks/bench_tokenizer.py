@@ -0,0 +1,44 @@
+"""Micro-benchmark of Tokenizer.tokenize over long generated formulas.
+
+The time per token should stay roughly constant when the formula
+grows, i.e. tokenizing is linear in the length of the formula.
+
+Run from the repository root:
+    export PYTHONPATH="$(pwd)/SpreadsheetMarkerForStudents/src"
+    python3 benchmarks/bench_tokenizer.py
+"""
+import timeit
+
+from spreadsheet.FormulaEvaluator import Tokenizer
+
+
+def generate_formula(num_terms: int) -> str:
+    """Generates a formula with `num_terms` terms mixing all the token types"""
+    terms = []
+    for idx in range(1, num_terms+1):
+        match idx % 4:
+            case 0:
+                terms.append(f"A{idx}")
+            case 1:
+                terms.append(f"{idx}")
+            case 2:
+                terms.append(f"(B{idx}*2)")
+            case 3:
+                terms.append(f"SUMA(A1:C{idx};{idx})")
+    return "+".join(terms)
+
+
+def main():
+    print(f"{'terms':>8} {'tokens':>8} {'total (ms)':>12} {'per token (us)':>15}")
+    for num_terms in (100, 1_000, 10_000, 100_000):
+        formula = generate_formula(num_terms)
+        num_tokens = len(Tokenizer().tokenize(formula))
+        repeat = max(1, 100_000 // num_terms)
+        seconds = min(timeit.repeat(lambda: Tokenizer().tokenize(formula), 
+                                    number=repeat, repeat=3)) / repeat
+        print(f"{num_terms:>8} {num_tokens:>8} {seconds*1e3:>12.3f} "
+              f"{seconds/num_tokens*1e6:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
+import sys
+
+import pytest
+
 from spreadsheet.Spreadsheet import Spreadsheet, Coordinates, Cell, Numerical
 from spreadsheet.CLI import CLI
-from spreadsheet.AppManager import AppManager
+from spreadsheet.Content import ContentFactory
+from spreadsheet.AppManager import AppManager, SpreadsheetIO
+
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.circular_dependency_exception import CircularDependencyException
 
 def test_app_manager_init():
     app = AppManager()
@@ -8,4 +15,199 @@ def test_app_manager_init():
     
 def test_app_manager_run():
     app = AppManager()
-    app.run()
\ No newline at end of file
+    app.run()
+
+def test_spreadsheet_io_load_sheet(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("1;;=A1+1\n\n;text\n")
+    sheet = SpreadsheetIO.load_sheet(path, sparse=True)
+    assert sheet.size() == (3, 3)
+    assert len(sheet.cells) == 3
+    assert sheet.get_cell(Coordinates.from_text("A1")).get_value() == 1
+    assert sheet.get_cell(Coordinates.from_text("B1")).get_value() == 0
+    assert sheet.get_cell(Coordinates.from_text("B3")).get_value() == "text"
+    formula = sheet.get_cell(Coordinates.from_text("C1")).get_content()
+    assert formula.get_representation() == "A1+1"
+
+
+def test_spreadsheet_io_save_sheet(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    sheet = Spreadsheet("test", 4, 3, sparse=True)
+    sheet.set_content(Coordinates.from_text("A1"), Numerical(1))
+    sheet.set_content(Coordinates.from_text("C1"), ContentFactory.get("=SUMA(A1;2)"))
+    sheet.set_content(Coordinates.from_text("B3"), ContentFactory.get("text"))
+    SpreadsheetIO.save_sheet(sheet, path)
+    assert path.read_text() == "1;;=SUMA(A1,2)\n\n;text\n\n"
+
+
+def test_load_evaluates_formulas(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("=B1*2;=C1+A2;1\n=SUMA(C1:C3)\n;;;=1+\n")
+    app = AppManager()
+    app.load_spreadsheet_from_file(path)
+    assert app.get_cell_content_as_float("A1") == 4
+    assert app.recalculator.evaluations == 3
+    assert Coordinates.from_text("D3") in app.recalculator.errors
+    
+    # Dependencies are registered, so edits recompute the loaded formulas
+    app.set_cell_content("C1", "2")
+    assert app.get_cell_content_as_float("A1") == 8
+
+
+def test_load_reverse_chain(tmp_path):
+    # Every formula reads the next row
+    path = tmp_path / "sheet.s2v"
+    path.write_text("".join(f"=A{row+1}+1\n" for row in range(1, 500)) + "1\n")
+    app = AppManager()
+    app.load_spreadsheet_from_file(path)
+    assert app.get_cell_content_as_float("A1") == 500
+    assert app.cell_dependencies.is_ordered()
+    app.set_cell_content("A500", "2")
+    assert app.get_cell_content_as_float("A1") == 501
+
+
+def test_load_circular_dependencies(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("=B1;=C1;=A1\n")
+    app = AppManager()
+    app.set_cell_content("A1", "1")
+    with pytest.raises(CircularDependencyException):
+        app.load_spreadsheet_from_file(path)
+    assert app.get_cell_content_as_float("A1") == 1
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_snapshot_roundtrip(tmp_path, columnar):
+    app = AppManager(columnar=columnar)
+    app.set_cell_content("A1", "1.5")
+    app.set_cell_content("A2", "2")
+    app.set_cell_content("B1", "héllo")
+    app.set_cell_content("C1", "=SUMA(A1:A2)+A2")
+    app.set_cell_content("C2", "=C1*2")
+    app.execute_command("S", path=str(tmp_path / "sheet.s2b"))
+
+    loaded = AppManager(sparse=True, columnar=columnar)
+    loaded.execute_command("L", path=str(tmp_path / "sheet.s2b"))
+    assert loaded.spreadsheet.size() == app.spreadsheet.size()
+    assert loaded.get_cell_content_as_string("B1") == "héllo"
+    assert loaded.get_cell_content_as_float("C2") == 11
+    # Values and dependencies come from the snapshot, nothing is evaluated
+    assert loaded.recalculator.evaluations == 0
+    loaded.set_cell_content("A2", "3")
+    assert loaded.get_cell_content_as_float("C2") == 15
+    assert loaded.get_cell_formula_expression("C1") == "=SUMA(A1:A2)+A2"
+
+
+def test_snapshot_reverse_chain(tmp_path):
+    # Every formula reads the next row
+    app = AppManager()
+    app.set_cells({f"A{row}": f"=A{row+1}+1" for row in range(1, 500)} | {"A500": "1"})
+    app.save_spreadsheet_to_file(str(tmp_path / "sheet.s2b"))
+
+    loaded = AppManager()
+    loaded.load_spreadsheet_from_file(str(tmp_path / "sheet.s2b"))
+    assert loaded.cell_dependencies.is_ordered()
+    loaded.set_cell_content("A500", "2")
+    assert loaded.get_cell_content_as_float("A1") == 501
+
+
+def test_snapshot_text_valued_formulas(tmp_path):
+    app = AppManager()
+    app.set_cell_content("A1", "hello")
+    app.set_cell_content("B1", "=A1")
+    app.set_cell_content("C1", "=B1")
+    app.save_spreadsheet_to_file(str(tmp_path / "sheet.s2b"))
+
+    loaded = AppManager()
+    loaded.load_spreadsheet_from_file(str(tmp_path / "sheet.s2b"))
+    assert loaded.recalculator.evaluations == 0
+    assert loaded.get_cell_content_as_string("B1") == "hello"
+    assert loaded.get_cell_content_as_string("C1") == "hello"
+    loaded.set_cell_content("A1", "bye")
+    assert loaded.get_cell_content_as_string("C1") == "bye"
+
+
+def test_snapshot_without_dependencies(tmp_path):
+    path = tmp_path / "sheet.s2b"
+    SpreadsheetIO.save_snapshot(Spreadsheet.from_values([[2, "=A1*3"]]), path)
+    app = AppManager()
+    app.load_spreadsheet_from_file(path)
+    assert app.get_cell_content_as_float("B1") == 6
+
+
+def test_lazy_load(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("=B1*2;=C1+A2;1\n=SUMA(C1:C3)\n;;;=1+\n\n;;4;=A1\n")
+    app = AppManager()
+    app.load_spreadsheet_from_file(path, lazy=True)
+    assert app.spreadsheet.cells == {}
+    assert app.get_cell_content_as_float("A1") == 4
+    # Only the rows read by A1 and its precedents (A2 reads C1:C3) are parsed
+    assert {cell.get_coordinates().row for cell in app.spreadsheet.cells.values()} == {1, 2, 3}
+    
+    app.set_cell_content("C1", "2")
+    assert app.get_cell_content_as_float("A1") == 8
+    assert app.get_cell_content_as_float("D5") == 8
+    assert app.spreadsheet.size() == (4, 5)
+    with pytest.raises(Exception):
+        app.get_cell_content_as_float("D3")
+    assert Coordinates.from_text("D3") in app.spreadsheet.errors
+
+
+def test_lazy_load_long_chain(tmp_path):
+    num_rows = 3 * sys.getrecursionlimit()
+    path = tmp_path / "sheet.s2v"
+    path.write_text("1\n" + "".join(f"=A{row-1}+1\n" for row in range(2, num_rows+1)))
+    app = AppManager()
+    app.load_spreadsheet_from_file(path, lazy=True)
+    assert app.get_cell_content_as_float(f"A{num_rows}") == num_rows
+    assert app.spreadsheet.errors == {}
+
+
+def test_lazy_load_errors(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("=1/0;=A1+1\n")
+    app = AppManager()
+    app.load_spreadsheet_from_file(path, lazy=True)
+    # The error of the formula is raised, not a generic one
+    with pytest.raises(ZeroDivisionError):
+        app.get_cell_content_as_float("B1")
+    with pytest.raises(ZeroDivisionError):
+        app.get_cell_content_as_float("A1")
+    app.set_cell_content("A1", "=2")
+    assert app.get_cell_content_as_float("B1") == 3
+
+
+def test_lazy_load_closes_replaced_sheet(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("1;=A1+1\n")
+    app = AppManager()
+    app.load_spreadsheet_from_file(path, lazy=True)
+    lazy_sheet = app.spreadsheet
+    app.load_spreadsheet_from_file(path, lazy=True)
+    assert lazy_sheet._file.closed
+    lazy_sheet = app.spreadsheet
+    app.create_new_sheet()
+    assert lazy_sheet._file.closed
+
+
+def test_lazy_load_circular_dependencies(tmp_path):
+    path = tmp_path / "sheet.s2v"
+    path.write_text("=B1;=A1\n")
+    app = AppManager()
+    app.load_spreadsheet_from_file(path, lazy=True)
+    with pytest.raises(CircularDependencyException):
+        app.get_cell_content_as_float("A1")
+
+
+def test_columnar_range_sums():
+    app = AppManager(columnar=True)
+    for row in range(1, 101):
+        app.set_cell_content(f"A{row}", str(row))
+    app.set_cell_content("A50", "=A1*1000")
+    app.set_cell_content("B1", "=SUMA(A1:A100)")
+    app.set_cell_content("B2", "=PROMEDIO(A1:A100;B1)")
+    assert app.get_cell_content_as_float("B1") == 5050 - 50 + 1000
+    app.set_cell_content("A1", "2")
+    assert app.get_cell_content_as_float("B1") == 5050 - 50 + 2001
+    assert app.get_cell_content_as_float("B2") == 2 * (5050 - 50 + 2001) / 101
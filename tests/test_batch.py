@@ -0,0 +1,91 @@
+import pytest
+
+from spreadsheet.AppManager import AppManager
+from spreadsheet.Spreadsheet import Coordinates
+
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.circular_dependency_exception import CircularDependencyException
+
+
+def test_batch_recalculates_once():
+    app = AppManager()
+    app.set_cell_content("A1", "1")
+    app.set_cell_content("B1", "=A1*2")
+    app.set_cell_content("C1", "=B1+A2")
+    with app.batch():
+        app.set_cell_content("A1", "2")
+        app.set_cell_content("A2", "10")
+        app.set_cell_content("D1", "=C1+1")
+    assert app.recalculator.evaluations == 3
+    assert app.get_cell_content_as_float("D1") == 15
+
+
+def test_set_cells():
+    app = AppManager()
+    # Formulas can be introduced before the cells they depend on
+    app.set_cells({"B1": "=A1+A2", "A1": "1", "A2": "=A1*3"})
+    assert app.get_cell_content_as_float("B1") == 4
+    app.set_cell_content("A1", "2")
+    assert app.get_cell_content_as_float("B1") == 8
+
+
+def test_batch_rollback_on_cycle():
+    app = AppManager()
+    app.set_cells({"A1": "1", "B1": "=A1+1"})
+    with pytest.raises(CircularDependencyException):
+        app.set_cells({"C1": "=B1", "A1": "=C1"})
+    assert app.get_cell_content_as_float("A1") == 1
+    assert app.get_cell_content_as_float("B1") == 2
+    assert app.cell_dependencies.get_precedents(Coordinates.from_text("C1")) == set()
+    # The graph is back to its previous state, so edits still work
+    app.set_cell_content("A1", "3")
+    assert app.get_cell_content_as_float("B1") == 4
+
+
+def test_set_cells_reverse_chain():
+    # Every formula reads the next row, so the dependencies of the whole
+    # batch are added before ordering the formulas
+    size = 500
+    app = AppManager()
+    cells = {f"A{row}": f"=A{row+1}+1" for row in range(1, size)}
+    cells[f"A{size}"] = "1"
+    app.set_cells(cells)
+    assert app.get_cell_content_as_float("A1") == size
+    assert app.cell_dependencies.is_ordered()
+    with pytest.raises(CircularDependencyException):
+        app.set_cells({f"B{row}": f"=A{row}" for row in range(1, 100)} | {f"A{size}": "=A1"})
+    assert app.cell_dependencies.is_ordered()
+    assert app.cell_dependencies.get_precedents(Coordinates.from_text("B1")) == set()
+    app.set_cell_content(f"A{size}", "2")
+    assert app.get_cell_content_as_float("A1") == size + 1
+
+
+def test_batch_rollback_on_error():
+    app = AppManager()
+    app.set_cells({"A1": "1", "B1": "=1/A1"})
+    with pytest.raises(ZeroDivisionError):
+        with app.batch():
+            app.set_cell_content("C1", "7")
+            app.set_cell_content("A1", "0")
+    assert app.get_cell_content_as_float("B1") == 1
+    assert app.get_cell_content_as_float("C1") == 0
+
+
+def test_run_script(tmp_path):
+    path = tmp_path / "script.txt"
+    path.write_text("C\nE A1 1\nE B1 =A1*2\nE C1 =B1+\nE A1 3\n\nwrong\nE D1 =B1+1\n")
+    app = AppManager()
+    summary = app.run_script(path)
+    assert summary.commands == 7
+    assert summary.errors == 2
+    # The wrong formula does not discard the rest of the edits
+    assert app.get_cell_content_as_float("B1") == 6
+    assert app.get_cell_content_as_float("D1") == 7
+
+
+def test_run_script_nested(tmp_path):
+    (tmp_path / "inner.txt").write_text("E A1 5\n")
+    path = tmp_path / "script.txt"
+    path.write_text(f"E B1 =A1+1\nRF {tmp_path / 'inner.txt'}\n")
+    app = AppManager()
+    app.run_script(path)
+    assert app.get_cell_content_as_float("B1") == 6
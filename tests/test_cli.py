@@ -1,5 +1,5 @@
 from spreadsheet.Spreadsheet import Spreadsheet, Coordinates, Cell, Numerical
-from spreadsheet.CLI import CLI
+from spreadsheet.CLI import CLI, parse_command
 
 def test_cli_init():
     cli = CLI()
@@ -9,4 +9,40 @@ def test_cli_print_table():
     cli = CLI()
     spreadsheet = Spreadsheet("test", 10, 10)
     cli.print_spreadsheet(spreadsheet)
-    assert False
\ No newline at end of file
+    assert False
+
+def test_parse_command():
+    assert parse_command("RF script.txt") == ("RF", {"path": "script.txt"})
+    assert parse_command("E A1 =B1+1") == ("E", {"coordinates": "A1", "content": "=B1+1"})
+    assert parse_command("SCROLL DOWN 5") == ("SCROLL", {"direction": "DOWN", "amount": "5"})
+    assert parse_command("X") is None
+
+
+def test_cli_viewport():
+    cli = CLI(viewport_columns=3, viewport_rows=2)
+    spreadsheet = Spreadsheet("test", 1000, 1000, sparse=True)
+    cli.print_spreadsheet(spreadsheet)
+    table = cli._table
+    assert len(table.columns) == 4
+    assert table.row_count == 2
+    # Nothing changed inside the window: the table is reused
+    spreadsheet.set_content(Coordinates(10, 10), Numerical(1))
+    cli.print_spreadsheet(spreadsheet)
+    assert cli._table is table
+    cli.scroll("DOWN")
+    cli.scroll("RIGHT", 5)
+    assert cli.origin == Coordinates(6, 3)
+    cli.jump(Coordinates.from_text("J10"))
+    cli.print_spreadsheet(spreadsheet)
+    assert cli._table is not table
+    assert table.columns[1].header == "A"
+    assert cli._table.columns[1].header == "J"
+
+
+def test_cli_view_off():
+    cli = CLI()
+    cli.set_view("OFF")
+    cli.print_spreadsheet(Spreadsheet("test", 10, 10))
+    assert cli._table is None
+    cli.set_view("4x5")
+    assert (cli.viewport_columns, cli.viewport_rows) == (4, 5)
@@ -0,0 +1,170 @@
+import pytest
+
+from spreadsheet.AppManager import AppManager
+from spreadsheet.DependencyGraph import DependencyGraph
+from spreadsheet.Spreadsheet import Coordinates, CellRange
+
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.circular_dependency_exception import CircularDependencyException
+
+A1, A2, A3, B1 = (Coordinates.from_text(c) for c in ("A1", "A2", "A3", "B1"))
+
+
+def test_dependency_graph_set_precedents():
+    graph = DependencyGraph()
+    graph.set_precedents(B1, {A1, A2})
+    assert graph.get_precedents(B1) == {A1, A2}
+    assert graph.get_dependents(A1) == {B1}
+    
+    delta = graph.set_precedents(B1, {A2, A3})
+    assert delta.removed == {A1}
+    assert delta.added == {A3}
+    assert graph.get_dependents(A1) == set()
+    assert graph.get_dependents(A3) == {B1}
+
+
+def test_dependency_graph_revert():
+    graph = DependencyGraph()
+    graph.set_precedents(B1, {A1, A2})
+    delta = graph.set_precedents(B1, {A3})
+    graph.revert(delta)
+    assert graph.get_precedents(B1) == {A1, A2}
+    assert graph.get_dependents(A3) == set()
+    assert graph.get_dependents(A2) == {B1}
+
+
+def test_dependency_graph_has_cycle():
+    graph = DependencyGraph()
+    graph.set_precedents(A2, {A1})
+    graph.set_precedents(A3, {A2})
+    assert not graph.has_cycle(A3)
+    graph.set_precedents(A1, {A3})
+    assert graph.has_cycle(A1)
+
+
+def test_circular_dependency_rollback():
+    app = AppManager()
+    app.set_cell_content("A1", "1")
+    app.set_cell_content("A2", "=A1+1")
+    app.set_cell_content("A3", "=A2+1")
+    with pytest.raises(CircularDependencyException):
+        app.set_cell_content("A1", "=A3+1")
+    assert app.cell_dependencies.get_precedents(A1) == set()
+    assert app.get_cell_content_as_float("A1") == 1
+    
+    # The sheet keeps recalculating after the rollback
+    app.set_cell_content("A1", "5")
+    assert app.get_cell_content_as_float("A3") == 7
+
+
+def test_dependency_graph_ranges():
+    graph = DependencyGraph()
+    graph.set_precedents(B1, {CellRange.from_text("A1:A100000")})
+    assert graph.get_dependents(Coordinates.from_text("A500")) == {B1}
+    assert len(graph.get_precedents(B1)) == 1
+    graph.set_precedents(B1, set())
+    assert graph.get_dependents(Coordinates.from_text("A500")) == set()
+
+
+def test_range_dependencies_recalculation():
+    app = AppManager(sparse=True)
+    app.set_cell_content("A2", "4")
+    app.set_cell_content("B1", "=SUMA(A1:A100000)")
+    assert app.get_cell_content_as_float("B1") == 4
+    app.set_cell_content("A99999", "6")
+    assert app.get_cell_content_as_float("B1") == 10
+    with pytest.raises(CircularDependencyException):
+        app.set_cell_content("A5", "=B1")
+
+
+def assert_valid_order(graph: DependencyGraph):
+    assert graph.is_ordered()
+    assert set(graph.order) == set(graph.precedents)
+    for cell in graph.order:
+        for dependent in graph.get_dependents(cell):
+            assert graph.order[cell] < graph.order[dependent]
+
+
+def test_dependency_graph_order_backwards_chain():
+    # Formulas written from the bottom up: every edge goes backwards
+    graph = DependencyGraph()
+    cells = [Coordinates(1, row) for row in range(1, 201)]
+    for row in range(len(cells)-1, 0, -1):
+        graph.set_precedents(cells[row], {cells[row-1]})
+    assert_valid_order(graph)
+    assert graph.sort(reversed(cells[1:])) == cells[1:]
+
+
+def test_dependency_graph_order_diamond():
+    # A diamond (B1 read twice through A2 and A3) is not a cycle
+    graph = DependencyGraph()
+    graph.set_precedents(B1, {A2, A3})
+    graph.set_precedents(A2, {A1})
+    graph.set_precedents(A3, {A1})
+    graph.set_precedents(A1, {Coordinates.from_text("C1")})
+    assert not graph.has_cycle(A1)
+    assert_valid_order(graph)
+
+
+def test_dependency_graph_order_cycle_revert():
+    graph = DependencyGraph()
+    graph.set_precedents(A2, {A1})
+    graph.set_precedents(A3, {CellRange.from_text("A1:A2")})
+    delta = graph.set_precedents(A1, {A3})
+    assert not graph.is_ordered()
+    assert graph.has_cycle(A1)
+    graph.revert(delta)
+    assert not graph.has_cycle(A1)
+    assert_valid_order(graph)
+
+
+def test_dependency_graph_cycle_revert_keeps_order(monkeypatch):
+    graph = DependencyGraph()
+    cells = [Coordinates(1, row) for row in range(1, 101)]
+    for row in range(1, len(cells)):
+        graph.set_precedents(cells[row], {cells[row-1]})
+    graph.set_precedents(cells[50], {cells[49], Coordinates(2, 1)})
+    delta = graph.set_precedents(cells[50], {cells[99]})
+    assert graph.has_cycle(cells[50])
+    # The order before the edit is still valid: it is not computed again
+    monkeypatch.setattr(graph, "_rebuild_order", lambda: pytest.fail("order rebuilt"))
+    graph.revert(delta)
+    assert_valid_order(graph)
+    assert graph.get_precedents(cells[50]) == {cells[49], Coordinates(2, 1)}
+
+
+def test_dependency_graph_set_many_precedents():
+    # Every cell reads the next row, so every edge goes backwards
+    graph = DependencyGraph()
+    cells = [Coordinates(1, row) for row in range(1, 2001)]
+    precedents = {cells[row]: {cells[row+1]} for row in range(len(cells)-1)}
+    graph.set_many_precedents(precedents)
+    assert_valid_order(graph)
+    deltas = graph.set_many_precedents({cell: {cells[0]} if cell == cells[-1] else {cells[-1]}
+                                        for cell in cells[-100:]})
+    assert not graph.is_ordered()
+    assert graph.has_cycle(cells[0])
+    graph.revert_many(deltas)
+    assert_valid_order(graph)
+    assert all(graph.get_precedents(cell) == cell_precedents
+               for cell, cell_precedents in precedents.items())
+
+
+def test_dependency_graph_order_random_edits():
+    import random
+    rng = random.Random(7)
+    graph = DependencyGraph()
+    cells = [Coordinates(col, row) for col in range(1, 5) for row in range(1, 11)]
+    for _ in range(500):
+        coords = rng.choice(cells)
+        precedents = set(rng.sample(cells, rng.randint(0, 3)))
+        if rng.random() < 0.2:
+            precedents.add(CellRange(Coordinates(1, rng.randint(1, 5)),
+                                     Coordinates(rng.randint(1, 4), rng.randint(6, 10))))
+        precedents.discard(coords)
+        delta = graph.set_precedents(coords, precedents)
+        if graph.has_cycle(coords):
+            graph.revert(delta)
+        assert_valid_order(graph)
+        cell_range = CellRange(Coordinates(2, 3), Coordinates(3, 8))
+        assert (set(graph._cells_in(cell_range))
+                == {cell for cell in graph.order if cell in cell_range})
@@ -1,6 +1,12 @@
-from spreadsheet.FormulaEvaluator import Tokenizer, PostfixExpressionManager
-from spreadsheet.Spreadsheet import Spreadsheet, Coordinates
-from spreadsheet.Content import Numerical
+import math
+
+import pytest
+
+from spreadsheet.FormulaEvaluator import Tokenizer, Parser, PostfixExpressionManager, FormulaEvaluator, FunctionCall
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates, CellRange
+from spreadsheet.Content import Numerical, Formula
+from spreadsheet.AggregateCache import AggregateCache
+from spreadsheet.AppManager import AppManager
 
 def test_tokenizer():
     expr = "MAX(A3:B3)+4*C5"
@@ -8,6 +14,18 @@ def test_tokenizer():
     tokens = tokenizer.tokenize(expr)
     expected = ['MAX', '(', 'A3:B3', ')', '+', '4', '*', 'C5']
     assert expected == [token for token, _ in tokens]
+
+
+def test_tokenizer_ids():
+    tokens = Tokenizer().iter_tokens("SUMA(A1:B2; 10) - C3")
+    assert next(tokens) == ("SUMA", 1)
+    assert list(tokens) == [("(", 5), ("A1:B2", 2), (";", 7), ("10", 4), 
+                            (")", 6), ("-", 0), ("C3", 3)]
+    
+
+def test_tokenizer_bad_expression():
+    with pytest.raises(Exception):
+        Tokenizer().tokenize("A1+a2")
     
     
 def test_parser_1():
@@ -73,4 +91,91 @@ def test_postfix_evaluation_2():
     expression = [1, 2, '+', 3, '*']
     mngr = PostfixExpressionManager()
     value = mngr.evaluate_postfix_expression(expression)
-    assert value == 9
\ No newline at end of file
+    assert value == 9
+
+
+def test_postfix_compilation():
+    tokens = (('(', 5), ('A1', 3), ('+', 0), ('2', 4), (')', 6), ('*', 0), ('3', 4))
+    mngr = PostfixExpressionManager()
+    program = mngr.compile_postfix_expression(tokens)
+    assert program == [Coordinates(1, 1), 2, '+', 3, '*']
+
+
+def test_formula_compiled_once():
+    spreadsheet = Spreadsheet('test', 10, 10)
+    spreadsheet.set_content(Coordinates.from_text('A1'), Numerical(1))
+    formula = Formula("=(A1+2)*3")
+    FormulaEvaluator(formula, spreadsheet).evaluate()
+    program = formula.get_program()
+    assert formula.get_value() == 9
+    
+    # Recomputing reuses the stored program
+    spreadsheet.set_content(Coordinates.from_text('A1'), Numerical(2))
+    FormulaEvaluator(formula, spreadsheet).evaluate()
+    assert formula.get_program() is program
+    assert formula.get_value() == 12
+
+
+
+def test_function_compilation():
+    tokens = Parser().parse(Tokenizer().tokenize("SUMA(A1:A3;2;MIN(B1;3))"))
+    program = PostfixExpressionManager().compile_postfix_expression(tokens)
+    assert program == [CellRange.from_text("A1:A3"), 2, Coordinates.from_text("B1"), 3,
+                       FunctionCall("MIN", 2), FunctionCall("SUMA", 3)]
+
+
+def test_function_evaluation():
+    spreadsheet = Spreadsheet('test', 10, 10)
+    for row in range(1, 11):
+        spreadsheet.set_content(Coordinates(1, row), Numerical(0.1))
+    formula = Formula("=SUMA(A1:A10)")
+    FormulaEvaluator(formula, spreadsheet).evaluate()
+    assert formula.get_value() == 1
+    formula = Formula("=PROMEDIO(A1:A10;B1:B10)*2+MAX(A1:B10;3)")
+    FormulaEvaluator(formula, spreadsheet).evaluate()
+    assert formula.get_value() == 3.1
+    formula = Formula("=SUMA(A1*10;2)")
+    FormulaEvaluator(formula, spreadsheet).evaluate()
+    assert formula.get_value() == 3
+
+
+@pytest.mark.parametrize("options", [{}, {"columnar": True}, {"lazy_evaluation": True}])
+def test_shared_range_aggregates(options):
+    app = AppManager(sparse=True, **options)
+    for row in range(1, 101):
+        app.set_cell_content(f"A{row}", str(row))
+    app.set_cell_content("A100", "=A99+1")
+    for row in range(1, 11):
+        app.set_cell_content(f"B{row}", f"=SUMA(A1:A100)+{row}")
+    app.set_cell_content("C1", "=PROMEDIO(A1:A100)")
+    assert app.get_cell_content_as_float("C1") == 50.5
+    assert len(app.spreadsheet.aggregates) == 1
+    # Edits inside the range and changes of the formulas inside it
+    # invalidate the result
+    app.set_cell_content("A99", "199")
+    assert app.get_cell_content_as_float("B3") == 5050 + 200 + 3
+    assert app.get_cell_content_as_float("C1") == (5050 + 200) / 100
+    app.set_cell_content("A200", "1")
+    assert app.get_cell_content_as_float("B10") == 5050 + 200 + 10
+
+
+def test_aggregate_cache():
+    cache = AggregateCache()
+    large, small = CellRange.from_text("A1:B100"), CellRange.from_text("A1:A2")
+    cache.put("SUMA", large, 10)
+    cache.put("MAX", large, 3)
+    cache.put("SUMA", small, 1)
+    assert cache.get("PROMEDIO", large) == 10
+    assert cache.get("SUMA", small) is None
+    cache.invalidate(Coordinates.from_text("C5"))
+    assert len(cache) == 2
+    cache.invalidate(Coordinates.from_text("B100"))
+    assert len(cache) == 0
+
+
+def test_reduce_large_range():
+    manager = PostfixExpressionManager()
+    values = [0.1 * idx for idx in range(2000)] + [1e17, -1e17]
+    assert manager._reduce_range('MIN', values) == min(values)
+    assert manager._reduce_range('MAX', values) == max(values)
+    assert manager._reduce_range('SUMA', values) == math.fsum(values)
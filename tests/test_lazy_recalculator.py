@@ -0,0 +1,44 @@
+import pytest
+
+from spreadsheet.AppManager import AppManager
+from spreadsheet.Spreadsheet import Coordinates
+
+
+def test_lazy_recalculation():
+    app = AppManager(lazy_evaluation=True)
+    app.set_cell_content("A1", "1")
+    for row in range(1, 101):
+        app.set_cell_content(f"B{row}", f"=A1+{row}")
+    app.set_cell_content("C1", "=B1+B2")
+    for value in range(2, 12):
+        app.set_cell_content("A1", str(value))
+    # Nothing is evaluated until the values are read
+    assert app.recalculator.evaluations == 0
+    assert len(app.recalculator.dirty) == 101
+    assert app.get_cell_content_as_float("C1") == 25
+    assert app.recalculator.evaluations == 3
+    # The values are kept until a precedent changes
+    assert app.get_cell_content_as_float("B2") == 13
+    assert app.recalculator.evaluations == 3
+    assert app.get_cell_content_as_float("B100") == 111
+
+
+def test_lazy_recalculation_long_chain():
+    app = AppManager(lazy_evaluation=True, sparse=True)
+    app.set_cell_content("A1", "1")
+    for row in range(2, 5001):
+        app.set_cell_content(f"A{row}", f"=A{row-1}+1")
+    app.set_cell_content("A1", "2")
+    assert app.get_cell_content_as_float("A5000") == 5001
+    assert not app.recalculator.dirty
+
+
+def test_lazy_recalculation_ranges_and_errors():
+    app = AppManager(lazy_evaluation=True)
+    app.set_cells({"A1": "1", "A2": "=A1*2", "B1": "=SUMA(A1:A2)", "C1": "=1/A1"})
+    assert app.get_cell_content_as_float("B1") == 3
+    app.set_cell_content("A1", "0")
+    with pytest.raises(ZeroDivisionError):
+        app.get_cell_content_as_float("C1")
+    assert Coordinates.from_text("C1") in app.recalculator.errors
+    assert app.get_cell_content_as_float("B1") == 0
@@ -0,0 +1,47 @@
+import pytest
+
+from spreadsheet.AppManager import AppManager
+from spreadsheet.ParallelRecalculator import ParallelRecalculator
+from spreadsheet.DependencyGraph import DependencyGraph
+from spreadsheet.Spreadsheet import Coordinates
+
+
+@pytest.fixture
+def app():
+    app = AppManager(workers=2)
+    # Use the pool even for tiny levels
+    app.recalculator.min_parallel_size = 1
+    yield app
+    app.recalculator.shutdown()
+
+
+def test_parallel_recalculator_levels():
+    a1, b1, c1, d1 = (Coordinates.from_text(c) for c in ("A1", "B1", "C1", "D1"))
+    dependencies = DependencyGraph()
+    dependencies.set_precedents(b1, {a1})
+    dependencies.set_precedents(c1, {a1})
+    dependencies.set_precedents(d1, {b1, c1})
+    recalculator = ParallelRecalculator(2)
+    levels = recalculator.levels(recalculator.dirty_cells(a1, dependencies), dependencies)
+    assert len(levels) == 2
+    assert set(levels[0]) == {b1, c1}
+    assert levels[1] == [d1]
+
+
+def test_parallel_recalculation(app):
+    app.set_cell_content("A1", "1")
+    for row in range(1, 11):
+        app.set_cell_content(f"B{row}", f"=A1*{row}")
+    app.set_cell_content("C1", "=SUMA(B1:B10)")
+    app.set_cell_content("A1", "2")
+    assert app.recalculator.evaluations == 11
+    assert app.get_cell_content_as_float("B10") == 20
+    assert app.get_cell_content_as_float("C1") == 110
+
+
+def test_parallel_recalculation_error(app):
+    app.set_cell_content("A1", "1")
+    app.set_cell_content("B1", "=1/A1")
+    app.set_cell_content("B2", "=A1+1")
+    with pytest.raises(ZeroDivisionError):
+        app.set_cell_content("A1", "0")
@@ -0,0 +1,29 @@
+from spreadsheet.RangeIndex import RangeIndex
+from spreadsheet.Coordinates import Coordinates, CellRange
+
+
+def test_range_index_covering():
+    index = RangeIndex()
+    index.add(CellRange.from_text("A1:A100000"), "tall")
+    index.add(CellRange.from_text("A5:B6"), "small")
+    index.add(CellRange.from_text("C1:C3"), "other")
+    assert index.covering(Coordinates.from_text("A5")) == {"tall", "small"}
+    assert index.covering(Coordinates.from_text("B6")) == {"small"}
+    assert index.covering(Coordinates.from_text("B7")) == set()
+    assert index.covering(Coordinates.from_text("A100000")) == {"tall"}
+    assert index.covering(Coordinates.from_text("A100001")) == set()
+
+
+def test_range_index_remove():
+    index = RangeIndex()
+    index.add(CellRange.from_text("A1:B10"), "owner")
+    index.add(CellRange.from_text("A1:B10"), "other")
+    index.remove(CellRange.from_text("A1:B10"), "owner")
+    assert len(index) == 1
+    assert index.covering(Coordinates.from_text("B2")) == {"other"}
+
+
+def test_range_normalization():
+    assert CellRange.from_text("B3:A1") == CellRange.from_text("A1:B3")
+    assert len(CellRange.from_text("A1:B3")) == 6
+    assert Coordinates.from_text("B2") in CellRange.from_text("A1:B3")
@@ -0,0 +1,38 @@
+from spreadsheet.AppManager import AppManager
+from spreadsheet.Recalculator import Recalculator
+from spreadsheet.DependencyGraph import DependencyGraph
+from spreadsheet.Spreadsheet import Coordinates
+
+
+def test_recalculator_topological_order():
+    a1, b1, c1, d1 = (Coordinates.from_text(c) for c in ("A1", "B1", "C1", "D1"))
+    dependencies = DependencyGraph()
+    dependencies.set_precedents(b1, {a1})
+    dependencies.set_precedents(c1, {a1})
+    dependencies.set_precedents(d1, {b1, c1})
+    order = Recalculator().dirty_cells(a1, dependencies)
+    assert len(order) == 3
+    assert order.index(d1) > order.index(b1)
+    assert order.index(d1) > order.index(c1)
+
+
+def test_recalculation_diamond():
+    app = AppManager()
+    app.set_cell_content("A1", "1")
+    app.set_cell_content("B1", "=A1+1")
+    app.set_cell_content("C1", "=A1*2")
+    app.set_cell_content("D1", "=B1+C1")
+    app.set_cell_content("A1", "2")
+    assert app.recalculator.evaluations == 3
+    assert app.get_cell_content_as_float("D1") == 7
+
+
+def test_recalculation_chained_diamonds():
+    app = AppManager()
+    app.set_cell_content("A1", "1")
+    # Each row doubles the number of paths from A1
+    for row in range(2, 12):
+        app.set_cell_content(f"A{row}", f"=A{row-1}+B{row-1}")
+        app.set_cell_content(f"B{row}", f"=A{row-1}")
+    app.set_cell_content("A1", "2")
+    assert app.recalculator.evaluations == 20
@@ -1,4 +1,15 @@
-from spreadsheet.Spreadsheet import Spreadsheet, Coordinates, Cell, Numerical, col_text2num
+import math
+import operator
+
+import pytest
+
+from spreadsheet.Spreadsheet import Spreadsheet, Coordinates, Cell, Numerical
+from spreadsheet.ColumnarSpreadsheet import ColumnarSpreadsheet
+from spreadsheet.Content import Text, Formula
+from spreadsheet.Coordinates import CellRange, COL_BITS, col_num2text, col_text2num, pack, unpack
+from spreadsheet.SegmentTree import SegmentTree
+
+from edu.upc.etsetb.arqsoft.spreadsheet.entities.bad_coordinate_exception import BadCoordinateException
 
 def test_spradsheet_init():
     spreadsheet = Spreadsheet("test", 10, 10)
@@ -45,4 +56,185 @@ def test_col_text2num():
     inputs = ["A", "B", "Z", "AA", "AB", "CD"]
     expect = [  1,   2,  26,   27,   28,  82]
     for (inp, exp) in zip(inputs, expect):
-        assert col_text2num(inp) == exp
\ No newline at end of file
+        assert col_text2num(inp) == exp
+
+def test_spreadsheet_sparse_init():
+    spreadsheet = Spreadsheet("test", 10, 10, sparse=True)
+    assert spreadsheet.size() == (10, 10)
+    assert len(spreadsheet.cells) == 0
+    assert spreadsheet.get_cell(Coordinates(5, 5)).get_value() == 0
+    assert len(spreadsheet.cells) == 0
+
+
+def test_spreadsheet_sparse_expand():
+    spreadsheet = Spreadsheet("test", 1, 1, sparse=True)
+    far_coords = Coordinates.from_text("ZZ100000")
+    spreadsheet.set_content(far_coords, Numerical(7))
+    assert spreadsheet.size() == (far_coords.col, 100000)
+    assert len(spreadsheet.cells) == 1
+    assert spreadsheet.get_cell(far_coords).get_value() == 7
+
+
+def test_spreadsheet_sparse_get_values():
+    spreadsheet = Spreadsheet("test", 3, 2, sparse=True)
+    spreadsheet.set_content(Coordinates(2, 1), Numerical(4))
+    spreadsheet.set_content(Coordinates(3, 2), Numerical(5))
+    assert spreadsheet.get_values() == [["0", "4", "0"], ["0", "0", "5"]]
+
+
+def test_spreadsheet_dense_expand():
+    spreadsheet = Spreadsheet("test", 2, 2)
+    spreadsheet.set_content(Coordinates(4, 3), Numerical(1))
+    assert spreadsheet.size() == (4, 3)
+    assert len(spreadsheet.cells) == 12
+
+
+def test_columnar_spreadsheet_storage():
+    spreadsheet = ColumnarSpreadsheet("test", 1, 1)
+    spreadsheet.set_content(Coordinates(2, 3), Numerical(4))
+    spreadsheet.set_content(Coordinates(2, 4), Numerical(2.5))
+    spreadsheet.set_content(Coordinates(1, 1), Text("abc"))
+    assert spreadsheet.size() == (2, 4)
+    assert len(spreadsheet.cells) == 1
+    assert spreadsheet.get_cell(Coordinates(2, 3)).get_value() == 4
+    assert spreadsheet.get_cell(Coordinates(2, 4)).get_value() == 2.5
+    assert spreadsheet.get_cell(Coordinates(2, 1)).get_value() == 0
+    # Replacing a number with a text moves it out of the column
+    spreadsheet.set_content(Coordinates(2, 3), Text("x"))
+    assert spreadsheet.get_cell(Coordinates(2, 3)).get_value() == "x"
+    assert spreadsheet.get_values() == [["abc", "0"], ["0", "0"], ["0", "x"], ["0", "2.5"]]
+
+
+def test_columnar_spreadsheet_range_values():
+    spreadsheet = ColumnarSpreadsheet.from_values([[1, 2], [3, "a"], [5, 6]])
+    assert spreadsheet.get_range_values(CellRange.from_text("A1:A5")) == [1, 3, 5, 0, 0]
+    assert spreadsheet.get_range_values(CellRange.from_text("A2:B3")) == [3, 5, "a", 6]
+
+
+def test_cells_without_instance_dict():
+    coords = Coordinates(2, 3)
+    cell = Cell(coords, Numerical(1))
+    for obj in (coords, cell, cell.get_content(), Text("a")):
+        assert not hasattr(obj, "__dict__")
+    assert hash(coords) == hash(Coordinates.from_text("B3"))
+    assert {coords: cell}[Coordinates(2, 3)] is cell
+
+
+def test_col_num2text():
+    inputs = [  1,   2,  26,   27,   28,  82,  702,   703, 18278]
+    expect = ["A", "B", "Z", "AA", "AB", "CD", "ZZ", "AAA", "ZZZ"]
+    for (inp, exp) in zip(inputs, expect):
+        assert col_num2text(inp) == exp
+        assert col_text2num(exp) == inp
+
+
+def test_coordinates_key():
+    coords = Coordinates.from_text("AB123")
+    assert (coords.col, coords.row) == (28, 123)
+    assert coords.key == pack(28, 123)
+    assert unpack(coords.key) == (28, 123)
+    assert Coordinates.from_key(coords.key) == coords
+    assert coords != coords.key
+
+
+def test_coordinates_bad_text():
+    for text in ("", "A", "1", "a1", "A1B", "A-1"):
+        with pytest.raises(BadCoordinateException):
+            Coordinates.from_text(text)
+    # Columns must fit in the packed key
+    assert Coordinates.from_text("AZZZZ1").col < 1 << COL_BITS
+    with pytest.raises(BadCoordinateException):
+        Coordinates.from_text("BAAAAA1")
+    with pytest.raises(BadCoordinateException):
+        Coordinates(1 << COL_BITS, 1)
+
+
+def test_spreadsheet_cells_by_coordinates():
+    spreadsheet = Spreadsheet("test", 2, 2)
+    coords = Coordinates.from_text("B2")
+    assert spreadsheet.cells[coords] is spreadsheet.cells[coords.key]
+    with pytest.raises(KeyError):
+        spreadsheet.cells[Coordinates.from_text("C3")]
+
+
+def test_spreadsheet_cells_keyed_by_int():
+    spreadsheet = Spreadsheet("test", 2, 2)
+    assert all(isinstance(key, int) for key in spreadsheet.cells)
+    coords = [coords for coords, _ in spreadsheet.iter_cells()]
+    assert set(coords) == {Coordinates(c, r) for c in (1, 2) for r in (1, 2)}
+
+
+def test_columnar_spreadsheet_range_sums():
+    spreadsheet = ColumnarSpreadsheet("test", 1, 1)
+    for row in range(1, 201):
+        spreadsheet.set_content(Coordinates(1, row), Numerical(row))
+    cell_range = CellRange.from_text("A1:B150")
+    assert spreadsheet.reduce_range("SUMA", cell_range) == sum(range(1, 151))
+    # Updates after the first sum are applied to the index
+    spreadsheet.set_content(Coordinates(1, 10), Numerical(0.5))
+    spreadsheet.set_content(Coordinates(2, 300), Numerical(7))
+    assert spreadsheet.reduce_range("SUMA", cell_range) == sum(range(1, 151)) - 9.5
+    formula = Formula("=1")
+    formula.set_value(100)
+    spreadsheet.set_content(Coordinates(2, 20), formula)
+    assert spreadsheet.reduce_range("PROMEDIO", cell_range) == sum(range(1, 151)) + 90.5
+    # Texts are reduced from the values, to raise the same error
+    spreadsheet.set_content(Coordinates(1, 30), Text("a"))
+    assert spreadsheet.reduce_range("SUMA", cell_range) is None
+    assert spreadsheet.reduce_range("MAX", cell_range) is None
+    assert spreadsheet.reduce_range("SUMA", CellRange.from_text("A1:A10")) is None
+
+
+def test_columnar_spreadsheet_range_sums_precision():
+    spreadsheet = ColumnarSpreadsheet("test", 1, 1)
+    spreadsheet.index_min_size = 1
+    for row in range(1, 201):
+        spreadsheet.set_content(Coordinates(1, row), Numerical(1e16 if row % 50 == 0 else 0.1 * row))
+    for first, last in ((1, 49), (51, 99), (1, 200), (10, 160)):
+        cell_range = CellRange(Coordinates(1, first), Coordinates(1, last))
+        assert (spreadsheet.reduce_range("SUMA", cell_range)
+                == pytest.approx(math.fsum(spreadsheet.get_range_values(cell_range)), rel=1e-12))
+    # Large values replaced by small ones do not leave rounding errors
+    for _ in range(20):
+        for row in range(1, 201, 3):
+            spreadsheet.set_content(Coordinates(1, row), Numerical(1e18))
+        for row in range(1, 201, 3):
+            spreadsheet.set_content(Coordinates(1, row), Numerical(0.3))
+    for row in range(50, 201, 50):
+        spreadsheet.set_content(Coordinates(1, row), Numerical(0.7))
+    cell_range = CellRange.from_text("A1:A200")
+    assert (spreadsheet.reduce_range("SUMA", cell_range)
+            == pytest.approx(math.fsum(spreadsheet.get_range_values(cell_range)), rel=1e-12))
+
+
+def test_segment_tree():
+    values = [3.0, -1.0, 4.0, 1.5, 0.0, 9.0, 2.0]
+    for function, reduce in ((min, min), (max, max), (operator.add, sum)):
+        tree = SegmentTree(values[:5], function)
+        for value in values[5:]:
+            tree.append(value)
+        for first in range(1, len(values)+1):
+            for last in range(first, len(values)+1):
+                assert tree.query(first, last) == reduce(values[first-1:last])
+        tree.set(2, 20)
+        assert tree.query(1, 3) == reduce([3, 20, 4])
+
+
+def test_columnar_spreadsheet_range_extremes():
+    import random
+    rng = random.Random(3)
+    spreadsheet = ColumnarSpreadsheet("test", 1, 1)
+    spreadsheet.index_min_size = 1
+    for _ in range(300):
+        coords = Coordinates(rng.randint(1, 3), rng.randint(1, 120))
+        if rng.random() < 0.1:
+            content = Formula("=1")
+            content.set_value(rng.randint(-50, 50))
+        else:
+            content = Numerical(rng.uniform(-100, 100))
+        spreadsheet.set_content(coords, content)
+        first, last = sorted(rng.randint(1, 130) for _ in range(2))
+        cell_range = CellRange(Coordinates(1, first), Coordinates(rng.randint(1, 3), last))
+        values = spreadsheet.get_range_values(cell_range)
+        assert spreadsheet.reduce_range("MIN", cell_range) == min(values)
+        assert spreadsheet.reduce_range("MAX", cell_range) == max(values)